@@ -0,0 +1,117 @@
+#! /usr/bin/env python3
+# GPFPlot Library for Caching Parsed Output Files
+# Last modified: 2026-10-18
+#
+# The data parsed from a GAMESS/VB2000 output file is saved in a
+# compressed sidecar file (out_file + ".gpfcache.npz"), which is used
+# while the size, modification time and content of out_file are the same.
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+from core.parse_vb import parse_out
+from core.operations import group_matrix
+
+CACHE_VERSION = 2 # change it whenever the cache contents change
+
+def cache_name(out_file):
+	return out_file + ".gpfcache.npz"
+
+def file_key(filename):
+	""" Size, modification time and content hash of a file. """
+	st = os.stat(filename)
+	h = hashlib.sha256()
+	with open(filename, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 24), b""):
+			h.update(chunk)
+	return st.st_size, st.st_mtime_ns, h.hexdigest()
+
+def load_out(out_file, cache=True):
+	"""
+	Parse a GAMESS/VB2000 output file (see parse_out), or read
+	the parsed data from its cache if it is still valid."""
+	if cache:
+		key = file_key(out_file)
+		OUT = read_cache(cache_name(out_file), key)
+		if OUT is not None:
+			print(" Using cached data: " + cache_name(out_file))
+			return OUT
+
+	jobfile = open(out_file,'r')
+	jobtext = jobfile.readlines()
+	jobfile.close()
+	OUT = parse_out(jobtext)
+
+	if cache:
+		try:
+			write_cache(cache_name(out_file), key, OUT)
+		except OSError:
+			print(" Warning: cache file could not be written.")
+	return OUT
+
+def write_cache(name, key, OUT):
+	NATOMS, CHARGE, ATOMS, R, L, M, N, A, IATOM, CC,\
+    NBF, GL, C, hf, g99, CHF, OVERLAPS = OUT
+	# contractions and groups have different lengths: they are
+	# saved as flat arrays plus the length of each one
+	data = dict(version=CACHE_VERSION,
+                size=key[0], mtime=key[1], hash=key[2],
+                NATOMS=NATOMS, CHARGE=CHARGE, ATOMS=ATOMS, R=R,
+                L=L, M=M, N=N, IATOM=IATOM,
+                K=[len(x) for x in CC],
+                A=np.concatenate(A), CC=np.concatenate(CC),
+                NBF=NBF, GL=[len(x) for x in GL], C=C,
+                hf=hf, g99=g99, CHF=CHF)
+	if OVERLAPS is not None:
+		# blocks of the groups, in order (GL, or GL[:-1] for g99 files)
+		data["NSG"] = len(OVERLAPS.blocks)
+		data["OVERLAPS"] = np.concatenate([B.ravel()
+                                           for B in OVERLAPS.blocks])
+	# write to a temporary file first, so that a cache is never
+	# read while incomplete (a unique one, for concurrent runs)
+	f = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(name)),
+                                    prefix=os.path.basename(name),
+                                    suffix=".tmp", delete=False)
+	try:
+		with f:
+			np.savez_compressed(f, **data)
+		os.replace(f.name, name)
+	except BaseException:
+		os.remove(f.name)
+		raise
+
+def read_cache(name, key):
+	""" Data saved by write_cache, or None if it is not valid. """
+	try:
+		with np.load(name) as D:
+			return cache_data(D, key)
+	except Exception: # missing, corrupt or from an older version
+		return None
+
+def cache_data(D, key):
+	if int(D["version"]) != CACHE_VERSION or \
+       (int(D["size"]), int(D["mtime"]), str(D["hash"])) != key:
+		return None
+	split = np.cumsum(D["K"])[:-1]
+	A  = [x.tolist() for x in np.split(D["A"],  split)]
+	CC = [x.tolist() for x in np.split(D["CC"], split)]
+	GL = []
+	count = 0
+	for n in D["GL"]:
+		GL.append(list(range(count, count + n)))
+		count += n
+	if "OVERLAPS" in D:
+		SG = GL[:int(D["NSG"])]
+		split = np.cumsum([len(G)**2 for G in SG])[:-1]
+		OVERLAPS = group_matrix(SG,
+                       [B.reshape(len(G), len(G)) for G, B in
+                        zip(SG, np.split(D["OVERLAPS"], split))])
+	else:
+		OVERLAPS = None
+	return int(D["NATOMS"]), D["CHARGE"].tolist(),\
+           D["ATOMS"].tolist(), D["R"].tolist(),\
+           D["L"].tolist(), D["M"].tolist(), D["N"].tolist(),\
+           A, D["IATOM"].tolist(), CC,\
+           int(D["NBF"]), GL, D["C"], int(D["hf"]), bool(D["g99"]),\
+           D["CHF"], OVERLAPS
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+# GPFPlot Library for Saving and Loading Plot Grids
+# Last modified: 2026-10-18
+#
+# A binary grid file (*.npy) holds a single structured record: the
+# same information as the header of the text files (*.txt), followed
+# by the grid itself in double precision. It is read memory-mapped,
+# so opening a large grid does not read it at once.
+
+import os
+import numpy as np
+from datetime import datetime
+
+def save_txt(name, version, out_file, dens_file, gpf_file, mode,
+             plane, Xlim, Ylim, offset, gridp, PSI):
+	offplane = 'xyz'.replace( plane[0], "").replace( plane[1], "")
+	header ="""\
+Generated from GPF-PLOT version {0} at {1:%Y-%m-%d %H:%M:%S}
+GAMESS/VB2000 file:  {2}
+Density Matrix file: {3}
+GPF-PLOT input file: {4}
+{5}
+plane: {6}
+{7} range:  {8}
+{9} range:  {10}
+{11} offset: {12}
+gridpoints: {13}x{13}""".format(version, datetime.now(),
+                                os.path.abspath(out_file),
+                                os.path.abspath(dens_file),
+                                os.path.abspath(gpf_file), mode,
+                                plane, plane[0], Xlim, plane[1], Ylim,
+                                offplane, offset, gridp)
+	np.savetxt(name + ".txt", PSI, fmt="%11.6f", delimiter="",
+               header=header)
+
+def grid_dtype(paths, mode, shape):
+	return np.dtype([("version",   "U16"),
+                     ("out_file",  "U%d" %max(len(paths[0]), 1)),
+                     ("dens_file", "U%d" %max(len(paths[1]), 1)),
+                     ("gpf_file",  "U%d" %max(len(paths[2]), 1)),
+                     ("mode",      "U%d" %max(len(mode), 1)),
+                     ("plane",     "U2"),
+                     ("xlim",      "f8", (2,)),
+                     ("ylim",      "f8", (2,)),
+                     ("offset",    "f8"),
+                     ("gridp",     "i8"),
+                     ("psi",       "f8", shape)])
+
+def save_npy(name, version, out_file, dens_file, gpf_file, mode,
+             plane, Xlim, Ylim, offset, gridp, PSI):
+	paths = [os.path.abspath(x) if x != "" else ""
+             for x in (out_file, dens_file, gpf_file)]
+	PSI = np.asarray(PSI)
+	G = np.zeros(1, dtype=grid_dtype(paths, mode, PSI.shape))
+	G["version"] = version
+	G["out_file"], G["dens_file"], G["gpf_file"] = paths
+	G["mode"], G["plane"] = mode, plane
+	G["xlim"], G["ylim"] = Xlim, Ylim
+	G["offset"], G["gridp"] = offset, gridp
+	G["psi"] = PSI
+	np.save(name + ".npy", G)
+
+def load_npy(filename):
+	G = np.load(filename, mmap_mode='r')
+	return str(G["out_file"][0]), str(G["dens_file"][0]),\
+           str(G["gpf_file"][0]), str(G["mode"][0]), str(G["plane"][0]),\
+           tuple(G["xlim"][0].tolist()), tuple(G["ylim"][0].tolist()),\
+           float(G["offset"][0]), int(G["gridp"][0]), G["psi"][0]
+
+def load_txt(filename):
+	f = open(filename)
+	header = [f.readline() for i in range(10)]
+	f.close()
+	out_file  = header[1].split(":", 1)[1].strip()
+	dens_file = header[2].split(":", 1)[1].strip()
+	gpf_file  = header[3].split(":", 1)[1].strip()
+	mode      = header[4][2:].strip()
+	plane     = header[5].split()[-1]
+	# "# x range:  (xmin, xmax)"
+	Xlim = tuple(map(float, header[6].split(":")[1].strip(" ()[]\n").\
+                     split(",")))
+	Ylim = tuple(map(float, header[7].split(":")[1].strip(" ()[]\n").\
+                     split(",")))
+	offset = float( header[8].split()[-1] )
+	gridp = int( header[9].split()[-1].split("x")[0] )
+	PSI = np.loadtxt(filename, skiprows=10)
+	return out_file, dens_file, gpf_file, mode, plane, Xlim, Ylim,\
+           offset, gridp, PSI
+
+def load_grid(name):
+	"""
+	Grid saved by GPFPlot as name.npy (preferred) or name.txt, with
+	its header: out_file, dens_file, gpf_file, mode, plane, Xlim, Ylim,
+	offset, gridp, PSI."""
+	if os.path.exists(name + ".npy"):
+		return load_npy(name + ".npy")
+	return load_txt(name + ".txt")
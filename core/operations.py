@@ -1,10 +1,14 @@
 #! /usr/bin/env python3
 # GPFPlot Library for Orbital and Density Calculations
-# Last modified: 2025-02-24
+# Last modified: 2026-10-18
 #
 # Imports and functions ################################################
+import sys
 import numpy as np
+from mmap import mmap
+from collections import namedtuple
 from math import factorial as f
+from multiprocessing import get_context, get_all_start_methods
 
 # Global variables and functions #######################################
 
@@ -17,6 +21,8 @@ exp=np.exp
 M=np.multiply
 RAng=0.529177249 # angstrom / bohr
 floor = lambda x: int(np.math.floor(x))
+AxisIndex = {'x':0, 'y':1, 'z':2}
+PLANES = ("xy", "yx", "yz", "zy", "xz", "zx")
 
 # double factorial
 def df(n):
@@ -56,8 +62,8 @@ def NNorm(L,M,N,A,CC,NBF):
 	#end
 	return NN
 
-# Generate grid for each atom: Ri^2 and polinomial part of orbital
-def calcgrid(plane,Xlim,Ylim,gridp,offset,R, L,M,N, IATOM):
+# Generate the plotting grid
+def calcgrid(plane,Xlim,Ylim,gridp,offset):
 	# for plotting
 	Xrange = np.linspace(*Xlim,num=gridp)
 	Yrange = np.linspace(*Ylim,num=gridp)
@@ -65,121 +71,674 @@ def calcgrid(plane,Xlim,Ylim,gridp,offset,R, L,M,N, IATOM):
 	Yrange = Yrange/RAng # convert to bohr!
 	X1, Y1 = np.meshgrid(Xrange,Yrange)
 
-	# Construct grids
-	if plane == "xy":
-		X=X1; Y=Y1; Z=offset
-	elif plane == "yx":
-		X=Y1; Y=X1; Z=offset
-	elif plane == "yz":
-		X=offset; Y=X1; Z=Y1
-	elif plane == "zy":
-		X=offset; Y=Y1; Z=X1
-	elif plane == "xz":
-		X=X1; Y=offset; Z=Y1
-	elif plane == "zx":
-		X=Y1; Y=offset; Z=X1
-	else:
+	if plane not in PLANES:
 		print(" Error: Plane not valid.")
 		exit(1)
 	#endif
 
-	# number of atoms
-	NBF  = len(IATOM)
+	# GRID = plane, horizontal axis U, vertical axis V and the
+	#        coordinate W perpendicular to the plane (all in bohr)
+	GRID = (plane, Xrange, Yrange, offset)
+	return X1,Y1, GRID
 
-	Ri2 = np.zeros([NBF,gridp,gridp])
-	P   = np.zeros([NBF,gridp,gridp])
+# Indexes of the horizontal, vertical and perpendicular axes of a plane
+def plane_axes(plane):
+	iu = AxisIndex[plane[0]]
+	iv = AxisIndex[plane[1]]
+	return iu, iv, 3 - iu - iv
 
-	for i in range(NBF):
-		P[i]   = (X - R[0][IATOM[i]])**L[i] * (Y - R[1][IATOM[i]])**M[i] * (Z - R[2][IATOM[i]])**N[i] 
-		Ri2[i] = (X - R[0][IATOM[i]])**2 + (Y - R[1][IATOM[i]])**2 + (Z - R[2][IATOM[i]])**2
+# Shape of the orbital and density grids
+def grid_shape(GRID):
+	plane, U, V, W = GRID
+	if np.ndim(W) == 0: # single plane
+		return len(V), len(U)
+	return len(W), len(V), len(U)
+
+# Cartesian coordinates of a grid as broadcastable arrays
+def grid_xyz(GRID):
+	plane, U, V, W = GRID
+	XYZ = [None]*3
+	iu, iv, iw = plane_axes(plane)
+	XYZ[iu] = np.reshape(U, [1, 1, -1])
+	XYZ[iv] = np.reshape(V, [1, -1, 1])
+	XYZ[iw] = np.reshape(W, [-1, 1, 1])
+	if np.ndim(W) == 0: # single plane
+		XYZ = [G[0] for G in XYZ]
+	return XYZ
+
+# Cartesian coordinates of a list of points (U[k], V[k]) of a plane
+def points_xyz(GRID):
+	plane, U, V, W = GRID
+	XYZ = [None]*3
+	iu, iv, iw = plane_axes(plane)
+	XYZ[iu], XYZ[iv] = np.asarray(U), np.asarray(V)
+	XYZ[iw] = np.full(len(U), float(W))
+	return XYZ
+
+# Distance and polynomial tables, stored once per atom
+def atom_tables(X, Y, Z, R, L, M, N):
+	# Ri2  = [NATOMS, *grid] squared distances from each atom
+	# PXYZ = (PX, PY, PZ), PX = [NATOMS, max(L)+1, *X.shape] powers
+	#        (X-Rx)^l of each atom for every exponent l (same for Y, Z)
+	# X, Y, Z may be any arrays broadcastable to the grid shape
+	NATOMS = len(R[0])
+	shape = np.broadcast(X, Y, Z).shape
+	Ri2 = np.zeros([NATOMS, *shape])
+	PXYZ = []
+	for k, (G, LL) in enumerate(((X,L), (Y,M), (Z,N))):
+		D = G - np.reshape(R[k], [NATOMS] + [1]*G.ndim)	# [NATOMS,*G.shape]
+		Ri2 += D**2
+		PXYZ.append(np.stack([D**l for l in range(max(LL)+1)], axis=1))
+	#end
+	return Ri2, tuple(PXYZ)
+
+# 1D distance and polynomial tables along the U, V and W grid axes
+def axis_tables(GRID, R, L, M, N):
+	# D2 = (D2U, D2V, D2W), D2U = [NATOMS, len(U)] squared distances
+	# P  = (PU, PV, PW),    PU  = [NATOMS, lmax+1, len(U)] powers
+	# E  = (LU, LV, LW), exponents of each basis function along U, V, W
+	plane, U, V, W = GRID
+	LMN = (L, M, N)
+	D2 = []; P = []; E = []
+	for G, k in zip((U, V, np.atleast_1d(W)), plane_axes(plane)):
+		D = np.reshape(G, [1, -1]) - np.reshape(R[k], [-1, 1])
+		D2.append(D**2)
+		P.append(np.stack([D**l for l in range(max(LMN[k])+1)], axis=1))
+		E.append(np.asarray(LMN[k]))
+	#end
+	return tuple(D2), tuple(P), tuple(E)
+
+# Group basis functions into shells: consecutive functions on the same
+# atom sharing exponents and contraction coefficients have the same
+# radial part, which is then evaluated only once per shell.
+def make_shells(A, CC, IATOM):
+	# SATOM  = atom index of each shell
+	# SFIRST = index of the first basis function of each shell
+	# SSIZE  = number of basis functions (components) of each shell
+	# SK     = number of primitives of each shell
+	# SA, SC = exponents and coefficients, padded with zeros to the
+	#          largest contraction length
+	SATOM = []; SFIRST = []; SSIZE = []
+	for i in range(len(IATOM)):
+		if i > 0 and IATOM[i] == IATOM[i-1] and \
+           list(A[i]) == list(A[i-1]) and list(CC[i]) == list(CC[i-1]):
+			SSIZE[-1] += 1
+		else:
+			SATOM.append(IATOM[i])
+			SFIRST.append(i)
+			SSIZE.append(1)
+	#end
+	NS = len(SFIRST)
+	SK = np.array([len(CC[i]) for i in SFIRST], dtype=int)
+	SA = np.zeros([NS, max(SK)])
+	SC = np.zeros([NS, max(SK)])
+	for s in range(NS):
+		SA[s, :SK[s]] = A [SFIRST[s]]
+		SC[s, :SK[s]] = CC[SFIRST[s]]
+	#end
+	return np.array(SATOM), np.array(SFIRST), np.array(SSIZE), SK, SA, SC
+
+# Cutoff radius of each shell: beyond it, every primitive of the shell
+# is below thresh at any grid point (screening)
+def shell_radii(SHELLS, L, M, N, NN, thresh):
+	SATOM, SFIRST, SSIZE, SK, SA, SC = SHELLS
+	NS = len(SFIRST)
+	if thresh <= 0: # no screening
+		return np.full(NS, np.inf)
+	LT = np.asarray(L) + np.asarray(M) + np.asarray(N)
+	RS = np.zeros(NS)
+	for s in range(NS):
+		i, j, k = SFIRST[s], SFIRST[s] + SSIZE[s], SK[s]
+		# |NN*(x-Rx)^l*(y-Ry)^m*(z-Rz)^n*c*exp(-a*r^2)| <= thresh
+		# for r >= ri, solved by fixed-point iteration on ri
+		l = max(LT[i:j])
+		with np.errstate(divide='ignore'):
+			logc = np.log(max(abs(NN[i:j]))*abs(SC[s,:k])/thresh)
+		ri = np.zeros(k)
+		for it in range(6):
+			ri = logc + l*np.log(np.maximum(ri, 1.))
+			ri = sqrt(np.maximum(ri, 0.)/SA[s,:k])
+		RS[s] = max(ri)
+	#end
+	return RS
+
+# Basis functions needed by a set of orbitals: those with at least one
+# coefficient larger than tol (in absolute value)
+def needed_AOs(C, norbs, tol=0.):
+	C = np.asarray(C)[list(norbs)]
+	return np.nonzero(np.any(np.abs(C) > tol, axis=0))[0]
 
+# Calculate atomic orbitals on a grid
+def calc_AOs(SHELLS, L, M, N, R, NN, GRID, thresh=0., BF=None,
+             separable=True, points=False):
+	# The cartesian planes are axis-aligned, so every gaussian factors
+	# into 1D terms along U, V and W (separable path). The general path
+	# evaluates them on the full grid from the atom tables.
+	# With points, U and V of GRID are the coordinates of a list of
+	# points (always the general path).
+	# Shells farther than their cutoff radius are not evaluated.
+	# If BF is given, only these basis functions are calculated and
+	# returned (in this order, which must be increasing).
+	SATOM, SFIRST, SSIZE, SK, SA, SC = SHELLS
+	NBF = SFIRST[-1] + SSIZE[-1]
+	if BF is None:
+		BF = np.arange(NBF)
+	need = np.zeros(NBF, dtype=bool)
+	need[BF] = True
+	RS2 = shell_radii(SHELLS, L, M, N, NN, thresh)**2
+	if separable and not points:
+		AO_List = calc_AOs_sep(SHELLS, L, M, N, R, NN, GRID, RS2, need)
+	else:
+		X, Y, Z = points_xyz(GRID) if points else grid_xyz(GRID)
+		Ri2, PXYZ = atom_tables(X, Y, Z, R, L, M, N)
+		AO_List = calc_AOs_tab(SHELLS, L, M, N, Ri2, NN, PXYZ, RS2, need)
 	# DEBUG ############################################################
 	if DEBUG:
-		P.tofile("tempfiles/Pxyz.txt",sep=" ", format="%10.6f")
-		Ri2.tofile("tempfiles/Ri2.txt",sep=" ", format="%10.6f")
+		for n in range(len(AO_List)):
+			AO_List[n].tofile("tempfiles/AO%d.txt" %n,sep=" ",
+                              format="%10.6f")
 	####################################################################
-	return X1,Y1, P, Ri2
-		
-# Calculate atomic orbitals
-def calc_AOs(NBF, A, CC, Ri2, NN, Pxyz, gridp):
-	AO_List=[]
+	# one contiguous [NBF, npoints] array
+	return AO_List.reshape(len(AO_List), np.prod(AO_List.shape[1:]))
 
-	for i in range(NBF):
-		sumj=np.zeros( [ gridp,gridp ] )
-		for j in range(len(CC[i])):
-			sumj=sumj+CC[i][j]*exp(-A[i][j]*Ri2[i]) 
-		#end
-		AO=NN[i]*Pxyz[i]*sumj #
-	# DEBUG ############################################################
-		if DEBUG:
-			AO.tofile("tempfiles/AO%d.txt" %i,sep=" ", format="%10.6f")
-	####################################################################
-		AO_List.append( AO )
+# Calculate atomic orbitals, shell by shell, from the atom tables
+def calc_AOs_tab(SHELLS, L, M, N, Ri2, NN, PXYZ, RS2, need):
+	SATOM, SFIRST, SSIZE, SK, SA, SC = SHELLS
+	PX, PY, PZ = PXYZ
+	L, M, N = np.asarray(L), np.asarray(M), np.asarray(N)
+	ROW = np.cumsum(need) - 1 # position of each needed AO in AO_List
+	AO_List = np.zeros( [ROW[-1] + 1, *Ri2.shape[1:]] )
+
+	for s in range(len(SFIRST)):
+		c = np.nonzero(need[SFIRST[s] : SFIRST[s] + SSIZE[s]])[0]
+		if len(c) == 0:
+			continue # no component of this shell is needed
+		c += SFIRST[s]
+		i, j, k = ROW[c[0]], ROW[c[-1]] + 1, SK[s]
+		a = SATOM[s]
+		# points inside the cutoff radius
+		inside = Ri2[a] <= RS2[s]
+		if not inside.any():
+			continue
+		# contracted radial part, common to all components of the shell
+		RAD = np.tensordot(SC[s,:k],
+                     exp(-np.multiply.outer(SA[s,:k], Ri2[a][inside])), 1)
+		# angular part of every component at once, from the atom tables
+		P = PX[a, L[c]] * PY[a, M[c]] * PZ[a, N[c]]
+		P = np.broadcast_to(P, (j-i,) + inside.shape)[:, inside]
+		AO_List[i:j, inside] = NN[c,None]*P*RAD
 	#end
 	return AO_List
 
-# Calculate orbital in terms of AOs
-def calc_orb(NBF, AO_List, C, norb, gridp):
-	# define wavefunction grid
-	PSI = np.zeros( [ gridp,gridp ] )
-	for i in range(NBF):
-		PSI=PSI+C[norb][i]*AO_List[i]
+# Calculate atomic orbitals, shell by shell, on a separable grid:
+# exp(-a*r^2) = exp(-a*du^2)*exp(-a*dv^2)*exp(-a*dw^2), so only the 1D
+# exponentials are computed and the grid is assembled by outer products
+def calc_AOs_sep(SHELLS, L, M, N, R, NN, GRID, RS2, need):
+	SATOM, SFIRST, SSIZE, SK, SA, SC = SHELLS
+	plane, U, V, W = GRID
+	(D2U, D2V, D2W), (PU, PV, PW), (LU, LV, LW) = \
+        axis_tables(GRID, R, L, M, N)
+	nu, nv, nw = len(U), len(V), D2W.shape[1]
+	ROW = np.cumsum(need) - 1 # position of each needed AO in AO_List
+	AO_List = np.zeros( [ROW[-1] + 1, nw, nv, nu] )
+
+	for s in range(len(SFIRST)):
+		c = np.nonzero(need[SFIRST[s] : SFIRST[s] + SSIZE[s]])[0]
+		if len(c) == 0:
+			continue # no component of this shell is needed
+		c += SFIRST[s]
+		i, j, k = ROW[c[0]], ROW[c[-1]] + 1, SK[s]
+		a = SATOM[s]
+		# bounding box of the cutoff sphere on the grid
+		bw = window(D2W[a], RS2[s])
+		if bw is None:
+			continue # sphere does not reach the plane(s)
+		bu = window(D2U[a], RS2[s] - D2W[a, bw].min())
+		bv = window(D2V[a], RS2[s] - D2W[a, bw].min())
+		if bu is None or bv is None:
+			continue # sphere outside the plot window
+		alpha = SA[s,:k,None]
+		EU = exp(-alpha*D2U[a, bu])				# [k, nu]
+		EV = exp(-alpha*D2V[a, bv])				# [k, nv]
+		EW = SC[s,:k,None]*exp(-alpha*D2W[a, bw])	# [k, nw]
+		# contracted radial part: sum of k rank-1 terms
+		RAD = (EW[:,:,None]*EV[:,None,:]).reshape(k, -1).T @ EU
+		# angular part: outer product of the 1D polynomials
+		PWV = NN[c,None,None]*PW[a, LW[c], bw, None]*PV[a, LV[c], None, bv]
+		AO = PWV.reshape(j-i, -1, 1)*PU[a, LU[c], None, bu]*RAD
+		AO_List[i:j, bw, bv, bu] = AO.reshape(*PWV.shape, -1)
 	#end
-	return PSI
+	if np.ndim(W) == 0: # single plane
+		AO_List = AO_List[:,0]
+	return AO_List
+
+# Slice of a grid axis where the squared distance D2 is within R2
+def window(D2, R2):
+	inside = np.nonzero(D2 <= R2)[0]
+	if len(inside) == 0:
+		return None
+	return slice(inside[0], inside[-1] + 1)
+
+# Group matrices: the overlap and density matrices of VB orbitals are
+# block diagonal, with one block per electron group. They are kept as
+# GroupMatrix(groups, blocks), groups[g] being the orbitals (by index,
+# starting at 0) of group g and blocks[g] the corresponding square matrix.
+GroupMatrix = namedtuple('GroupMatrix', 'groups blocks')
+
+def group_matrix(GL, BLOCKS):
+	return GroupMatrix([np.asarray(G, dtype=int) for G in GL],
+                       [np.asarray(B, dtype=float) for B in BLOCKS])
+
+# Split a set of orbitals by group and take the submatrices: orbitals
+# of different groups are not coupled by S or P, so each group of the
+# set gives an independent contribution.
+def group_args(N, *MATS):
+	# N    = Set of orbitals (by index, starting at 1)
+	# MATS = group matrices (or dense arrays, taken as a single group)
+	r = np.array([i - 1 for i in N], dtype=int)
+	GM = next((X for X in MATS if isinstance(X, GroupMatrix)), None)
+	GROUPS = [np.arange(len(MATS[0]))] if GM is None else GM.groups
+	for g, G in enumerate(GROUPS):
+		pos = np.isin(r, G)
+		if not pos.any(): continue
+		rg = r[pos]
+		k = np.searchsorted(G, rg) # position of each orbital in G
+		yield (rg,) + tuple(X.blocks[g][np.ix_(k, k)]
+                            if isinstance(X, GroupMatrix) else
+                            np.asarray(X)[np.ix_(rg, rg)]
+                            for X in MATS)
+
+# Same, with the stacked grids of the orbitals of each group
+def dens_args(N, PHI, *MATS):
+	# PHI = list of orbital grids, indexed by orbital
+	for ARGS in group_args(N, *MATS):
+		yield (ARGS[0], np.stack([PHI[a] for a in ARGS[0]])) + ARGS[1:]
+
+# Sum of the contributions of each group to a density
+def dens_sum(kernel, N, PHI, *MATS):
+	RHO = np.zeros(np.shape(PHI[N[0] - 1]))
+	for ARGS in dens_args(N, PHI, *MATS):
+		RHO += kernel(*ARGS)
+	return RHO
+
+# sum_rs Q[r][s]*PHI[r]*PHI[s] for stacked orbital grids
+def quad_form(PHI, Q):
+	return np.einsum('r...,r...->...', PHI, np.tensordot(Q, PHI, 1))
+
+# Density kernels over stacked orbital grids PHI = [n, ...] and the
+# corresponding [n, n] submatrices of S and P
+def dens_TOT(PHI, P):
+	return quad_form(PHI, P)
+
+def dens_NAT(PHI, P, occ_tol=0.):
+	# sum of the squares of the natural orbitals, weighted by their
+	# occupations
+	occ, U = natural_orbitals(P, occ_tol)
+	NAT = np.tensordot(U.T, PHI, 1)
+	return np.tensordot(occ, NAT*NAT, 1)
+
+def dens_QC(PHI, S, P):
+	# every square is weighted by the row sum of P*S
+	return np.tensordot(np.sum(P*S, axis=1), PHI*PHI, 1)
+
+def dens_INT(PHI, S, P, r):
+	# r = orbital index of each grid, diagonal pairs r == s are skipped
+	r = np.asarray(r)
+	P = P*(r[:,None] != r[None,:])
+	W = P*S
+	WS = np.sum(W, axis=1) + np.sum(W, axis=0)
+	return quad_form(PHI, P) - .5*np.tensordot(WS, PHI*PHI, 1)
 
-# Calculate all orbitals
-def calc_all(N, NBF, AO_List, C, gridp):
-	ORB_List=[]
-	for norb in range(N):
-		PSI= calc_orb(NBF, AO_List, C, norb, gridp)
-		# DEBUG ########################################################
-		if DEBUG:
-			PSI.tofile("tempfiles/PSI%d.txt" %norb,sep=" ", format="%10.6f")
-		################################################################
-		ORB_List.append( PSI )
-	return ORB_List
+# Natural orbitals of a (sub)matrix P: occupations and vectors (as
+# columns), dropping those with |occupation| <= occ_tol
+def natural_orbitals(P, occ_tol=0.):
+	occ, U = np.linalg.eigh(.5*(P + P.T))
+	keep = np.abs(occ) > occ_tol
+	return occ[keep], U[:, keep]
 
 # Calculate total density of a set of orbitals
-def calc_TOT(N, PHI, P, gridp):
+def calc_TOT(N, PHI, P, natural=False, occ_tol=0.):
 	# N   = Set of orbitals (by index, starting at 1) 
 	# PHI = list of orbital grids
 	# P   = one-electron density matrix in the orbital basis
-	RHO = np.zeros( [gridp, gridp] )
-	for i in N:
-		r = i -1
-		for j in N:
-			s = j - 1
-			RHO = RHO + M(PHI[r], PHI[s])*P[r][s]			
-	return RHO
+	# natural = sum over the natural orbitals of each group instead of
+	#           over all pairs of orbitals
+	if natural:
+		return dens_sum(lambda r, PHIs, Ps: dens_NAT(PHIs, Ps, occ_tol),
+                        N, PHI, P)
+	return dens_sum(lambda r, PHIs, Ps: dens_TOT(PHIs, Ps), N, PHI, P)
 
 # Calculate quasi-classical density of a set of orbitals
-def calc_QC(N, PHI, S, P, gridp):
+def calc_QC(N, PHI, S, P):
 	# N   = Set of orbitals (by index, starting at 1) 
 	# PHI = list of orbital grids
 	# S   = overlap matrix
 	# P   = one-electron density matrix in the orbital basis
-	RHO = np.zeros( [gridp, gridp] )
-	for i in N:
-		r = i - 1
-		for j in N:
-			s = j - 1
-			RHO = RHO + M(PHI[r], PHI[r])*P[r][s]*S[r][s]			
-	return RHO
+	return dens_sum(lambda r, PHIs, Ss, Ps: dens_QC(PHIs, Ss, Ps),
+                    N, PHI, S, P)
 
 # Calculate interference density of a set of orbitals
-def calc_INT(N, PHI, S, P, gridp):
+def calc_INT(N, PHI, S, P):
 	# N   = Set of orbitals (by index, starting at 1) 
 	# PHI = list of orbital grids
 	# S   = overlap matrix
 	# P   = one-electron density matrix in the orbital basis
-	RHO = np.zeros( [gridp, gridp] )
-	for i in N:
-		r = i - 1
-		PHIr2 = M(PHI[r], PHI[r])
-		for j in N:
-			s = j - 1
-			if r != s:
-				PHIs2    = M(PHI[s], PHI[s])
-				PHIrPHIs = M(PHI[r], PHI[s])
-				RHO = RHO + (PHIrPHIs -.5*S[r][s]*(PHIr2 + PHIs2))*P[r][s]			
-	return RHO
+	return dens_sum(lambda r, PHIs, Ss, Ps: dens_INT(PHIs, Ss, Ps, r),
+                    N, PHI, S, P)
+
+# Pipeline #############################################################
+# A job describes one result grid: the orbital coefficients C, the
+# orbitals it needs (by index, starting at 0) and how their grids are
+# turned into the result: "ORBS" (the orbitals themselves), "ORB" (a
+# single orbital), "QC", "INT" or "TOT" (density of the set OSET) and
+# "NAT" (sum of the squares of the orbitals, weighted by P).
+def job_orbs(C, norbs):
+	return (C, list(norbs), "ORBS", None, None, None)
+
+def job_orb(C, norb):
+	return (C, [norb], "ORB", None, None, None)
+
+def job_dens(mode, C, OSET, S, P, natural=False, occ_tol=0.):
+	if mode == "TOT" and natural:
+		return job_natural(C, OSET, P, occ_tol)
+	norbs = sorted(set(i - 1 for i in OSET))
+	return (C, norbs, mode, OSET, S, P)
+
+# Job of a program mode, given as a list of words (e.g. ["ORB", "3"] or
+# ["QC", "1", "2"]): VB orbitals C, HF orbitals CHF, overlaps S and
+# density matrix P
+def mode_job(mode, C, CHF, S=None, P=None, natural=False, occ_tol=0.):
+	if mode[0] == "ORB":
+		return job_orb(C, int(mode[1]) - 1)
+	elif mode[0] == "HFORB":
+		return job_orb(CHF, int(mode[1]) - 1)
+	return job_dens(mode[0], C, list(map(int, mode[1:])), S, P,
+                    natural, occ_tol)
+
+# Total density from the natural orbitals of each group of OSET: their
+# coefficients are formed once, so only one grid is calculated per
+# natural orbital and the density is a weighted sum of squares
+def job_natural(C, OSET, P, occ_tol=0.):
+	C = np.asarray(C)
+	OCC, CN = [], []
+	for r, Ps in group_args(OSET, P):
+		occ, U = natural_orbitals(Ps, occ_tol)
+		OCC.append(occ)
+		CN.append(U.T @ C[r])
+	CN = np.concatenate(CN)
+	return (CN, list(range(len(CN))), "NAT", OSET, None,
+            np.concatenate(OCC))
+
+# Result of a job from the grids of its orbitals
+def job_result(JOB, PHI):
+	C, norbs, mode, OSET, S, P = JOB
+	if mode == "ORBS":
+		return PHI
+	elif mode == "ORB":
+		return PHI[0]
+	elif mode == "NAT":
+		return np.tensordot(P, PHI*PHI, 1)
+	PHI = dict(zip(norbs, PHI))
+	if mode == "QC":
+		return calc_QC(OSET, PHI, S, P)
+	elif mode == "INT":
+		return calc_INT(OSET, PHI, S, P)
+	elif mode == "TOT":
+		return calc_TOT(OSET, PHI, P)
+
+# AOs needed by any of the jobs, and the coefficients of each job in
+# terms of them
+def job_coefs(JOBS, tol=0.):
+	BF = np.unique(np.concatenate([needed_AOs(J[0], J[1], tol)
+                                   for J in JOBS]))
+	CS = [np.asarray(J[0])[J[1]][:, BF] for J in JOBS]
+	return BF, CS
+
+# Split a grid into tiles of at most tile x tile points, together with
+# the index of each tile in the full grid
+def grid_tiles(GRID, tile=0):
+	plane, U, V, W = GRID
+	if tile <= 0: # no tiling
+		tile = max(len(U), len(V))
+	for v in range(0, len(V), tile):
+		for u in range(0, len(U), tile):
+			su, sv = slice(u, u + tile), slice(v, v + tile)
+			yield (plane, U[su], V[sv], W), (Ellipsis, sv, su)
+
+# Number of tiles given by grid_tiles
+def count_tiles(GRID, tile=0):
+	plane, U, V, W = GRID
+	if tile <= 0:
+		return 1
+	return -(-len(U)//tile) * -(-len(V)//tile)
+
+# Leading dimensions of the result of a job (before the grid shape)
+def job_shape(JOB):
+	if JOB[2] == "ORBS":
+		return (len(JOB[1]),)
+	return ()
+
+# Process pools are only used where the workers can be forked from the
+# main process: with spawn (Windows) each worker would run the gpfplot
+# script again, and fork is not safe on macOS.
+def parallel_ok():
+	return sys.platform != "darwin" and "fork" in get_all_start_methods()
+
+# Calculate the result grids of a list of jobs, tile by tile. Each tile
+# goes from the AOs to the final results before the next one, so only
+# the AOs of a single tile are kept in memory. With nprocs > 1 the tiles
+# are shared among a pool of processes, which write their results
+# directly into shared memory. If given, progress(done, total) is called
+# after each tile; an exception raised by it stops the calculation.
+def calc_psi(SHELLS, L, M, N, R, NN, GRID, JOBS,
+             thresh=0., tol=0., tile=0, nprocs=1, progress=None):
+	BF, CS = job_coefs(JOBS, tol)
+	SHAPES = [job_shape(J) + grid_shape(GRID) for J in JOBS]
+	ARGS = (SHELLS, L, M, N, R, NN, JOBS, CS, BF, thresh)
+
+	if nprocs <= 1 or not parallel_ok():
+		PSI = [np.zeros(S) for S in SHAPES]
+		total = count_tiles(GRID, tile)
+		for n, (GT, index) in enumerate(grid_tiles(GRID, tile)):
+			calc_tile(ARGS, PSI, GT, index)
+			if progress is not None: progress(n + 1, total)
+		return PSI
+
+	# about 4 tiles per process, if the tile size is not given
+	if tile <= 0:
+		tile = int(np.ceil(max(grid_shape(GRID)[-2:])/(2*sqrt(nprocs))))
+	# the results go to anonymous shared memory, inherited by the forked
+	# workers: the arrays returned own it, so nothing is copied and it
+	# is freed with them
+	PSI = [np.ndarray(S, buffer=mmap(-1, max(8*int(np.prod(S)), 1)))
+           for S in SHAPES]
+	with get_context("fork").Pool(nprocs, initializer=init_worker,
+                                  initargs=(ARGS, PSI)) as pool:
+		total = count_tiles(GRID, tile)
+		TILES = pool.imap_unordered(tile_worker, grid_tiles(GRID, tile))
+		for n, done in enumerate(TILES):
+			if progress is not None: progress(n + 1, total)
+	return PSI
+
+# Progressive calculation: the grid is calculated in stages, each one on
+# the sub-grid with every s-th point along each axis, from the coarsest
+# stride (about preview points along each axis) down to s = 1. Each
+# stage halves the stride, so the points of the previous ones are kept.
+def grid_strides(GRID, preview=40):
+	n = max(grid_shape(GRID)[-2:])
+	s = 1
+	while n/(2*s) >= preview:
+		s *= 2
+	strides = []
+	while s >= 1:
+		strides.append(s)
+		s //= 2
+	return strides
+
+# Calculate the points of the stage of stride s which are not in the
+# previous stage (stride prev, 0 for the first one) and store them in
+# the PSI grids (the full grids, see calc_psi)
+def calc_stage(SHELLS, L, M, N, R, NN, GRID, JOBS, PSI, s, prev=0,
+               thresh=0., tol=0., tile=0, nprocs=1, progress=None):
+	plane, U, V, W = GRID
+	iu, iv = np.arange(0, len(U), s), np.arange(0, len(V), s)
+	if prev == 0:
+		PARTS = [(iv, iu)]
+	else: # new rows, and the new columns of the old rows
+		old_u, old_v = iu % prev == 0, iv % prev == 0
+		PARTS = [(iv[~old_v], iu), (iv[old_v], iu[~old_u])]
+	for rows, cols in PARTS:
+		if len(rows) == 0 or len(cols) == 0:
+			continue
+		G = (plane, U[cols], V[rows], W)
+		RES = calc_psi(SHELLS, L, M, N, R, NN, G, JOBS,
+                       thresh, tol, tile, nprocs, progress)
+		for P, X in zip(PSI, RES):
+			P[..., rows[:, None], cols] = X
+
+def calc_progressive(SHELLS, L, M, N, R, NN, GRID, JOBS,
+                     thresh=0., tol=0., tile=0, nprocs=1):
+	"""
+	Same as calc_psi, but in stages (see grid_strides). Yields (s, PSI)
+	after each stage, PSI having the grids on every s-th point of each
+	axis; the last stage (s = 1) gives the full grids."""
+	PSI = [np.zeros(job_shape(J) + grid_shape(GRID)) for J in JOBS]
+	prev = 0
+	for s in grid_strides(GRID):
+		calc_stage(SHELLS, L, M, N, R, NN, GRID, JOBS, PSI, s, prev,
+                   thresh, tol, tile, nprocs)
+		prev = s
+		yield s, [P[..., ::s, ::s] for P in PSI]
+
+# Calculate the jobs on a list of points (U[k], V[k]) of the plane at
+# W, in chunks of points: the results are [..., npoints] arrays
+def calc_points(SHELLS, L, M, N, R, NN, plane, U, V, W, JOBS,
+                thresh=0., tol=0., chunk=4096):
+	BF, CS = job_coefs(JOBS, tol)
+	PSI = [np.zeros(job_shape(J) + (len(U),)) for J in JOBS]
+	for k in range(0, len(U), chunk):
+		G = (plane, U[k : k + chunk], V[k : k + chunk], W)
+		AO_List = calc_AOs(SHELLS, L, M, N, R, NN, G, thresh, BF,
+                           points=True)
+		for n in range(len(JOBS)):
+			PSI[n][..., k : k + chunk] = job_result(JOBS[n], CS[n] @ AO_List)
+	return PSI
+
+def calc_adaptive(SHELLS, L, M, N, R, NN, GRID, JOBS, adapt,
+                  thresh=0., tol=0., tile=0, nprocs=1):
+	"""
+	Same as calc_psi, with adaptive (quadtree) refinement: a coarse
+	grid (see grid_strides) is calculated and split into cells. For each
+	cell, the middle of the cell and of its edges are calculated and
+	compared with the bilinear interpolation from its corners. The cells
+	where the difference exceeds adapt times the largest absolute value
+	on the coarse grid, or with a nucleus less than 1 bohr from the
+	plane, are split in four and checked again; the points of the other
+	ones are interpolated. Returns the full grids and the number of
+	points calculated."""
+	plane, U, V, W = GRID
+	nv, nu = grid_shape(GRID)
+	s = grid_strides(GRID)[0]
+	iu = np.unique(np.append(np.arange(0, nu, s), nu - 1))
+	iv = np.unique(np.append(np.arange(0, nv, s), nv - 1))
+	PSI = [np.zeros(job_shape(J) + (nv, nu)) for J in JOBS]
+	known = np.zeros((nv, nu), dtype=bool)
+	RES = calc_psi(SHELLS, L, M, N, R, NN, (plane, U[iu], V[iv], W), JOBS,
+                   thresh, tol, tile, nprocs)
+	for P, X in zip(PSI, RES):
+		P[..., iv[:, None], iu] = X
+	known[np.ix_(iv, iu)] = True
+	npoints = len(iu)*len(iv)
+	SCALE = [adapt*max(np.abs(X).max(), 1e-300) for X in RES]
+
+	# nuclei near the plane, as (fractional) grid indexes
+	au, av, aw = plane_axes(plane)
+	near = np.abs(np.asarray(R[aw]) - W) < 1.
+	NU = (np.asarray(R[au])[near] - U[0])/(U[-1] - U[0])*(nu - 1)
+	NV = (np.asarray(R[av])[near] - V[0])/(V[-1] - V[0])*(nv - 1)
+
+	# cells, by the indexes of their corners
+	u0, v0 = [A.ravel() for A in np.meshgrid(iu[:-1], iv[:-1])]
+	u1, v1 = [A.ravel() for A in np.meshgrid(iu[1:], iv[1:])]
+	DONE = []
+	while len(u0) > 0:
+		um, vm = (u0 + u1)//2, (v0 + v1)//2
+		# middle of the edges and of the cell, 5 points per cell
+		PU = np.concatenate([um, um, u0, u1, um])
+		PV = np.concatenate([v0, v1, vm, vm, vm])
+		new = np.unique(PV[~known[PV, PU]]*nu + PU[~known[PV, PU]])
+		if len(new) > 0:
+			kv, ku = np.divmod(new, nu)
+			RES = calc_points(SHELLS, L, M, N, R, NN, plane, U[ku], V[kv],
+                              W, JOBS, thresh, tol)
+			for P, X in zip(PSI, RES):
+				P[..., kv, ku] = X
+			known[kv, ku] = True
+			npoints += len(new)
+
+		# interpolation error
+		CU = [np.tile(u0, 5), np.tile(u1, 5)]
+		CV = [np.tile(v0, 5), np.tile(v1, 5)]
+		TU = (PU - CU[0])/(CU[1] - CU[0])
+		TV = (PV - CV[0])/(CV[1] - CV[0])
+		err = np.zeros(len(u0))
+		for P, scale in zip(PSI, SCALE):
+			ERR = np.abs(P[..., PV, PU] - bilinear(P, *CU, *CV, TU, TV))
+			ERR = ERR.reshape(-1, 5, len(u0)).max(axis=(0, 1))
+			err = np.maximum(err, ERR/scale)
+		split = err > 1.
+		for a, b in zip(NU, NV):
+			split |= (u0 <= a) & (a <= u1) & (v0 <= b) & (b <= v1)
+		DONE.append((u0[~split], u1[~split], v0[~split], v1[~split]))
+
+		# the four quarters of the cells which are split
+		CELLS = [[], [], [], []]
+		for c0, c1 in ((u0, um), (um, u1)):
+			for d0, d1 in ((v0, vm), (vm, v1)):
+				keep = split & (c1 > c0) & (d1 > d0) & \
+                       ((c1 - c0 > 1) | (d1 - d0 > 1))
+				for C, X in zip(CELLS, (c0, c1, d0, d1)):
+					C.append(X[keep])
+		u0, u1, v0, v1 = [np.concatenate(C) for C in CELLS]
+
+	# interpolate the points not calculated, cells of the same size at once
+	for u0, u1, v0, v1 in DONE:
+		for du, dv in set(zip(u1 - u0, v1 - v0)):
+			sel = (u1 - u0 == du) & (v1 - v0 == dv)
+			rows = (v0[sel, None] + np.arange(dv + 1))[:, :, None]
+			cols = (u0[sel, None] + np.arange(du + 1))[:, None, :]
+			TU = np.arange(du + 1)/du
+			TV = np.arange(dv + 1)[:, None]/dv
+			mask = known[rows, cols]
+			for P in PSI:
+				I = bilinear(P, u0[sel, None, None], u1[sel, None, None],
+                             v0[sel, None, None], v1[sel, None, None], TU, TV)
+				P[..., rows, cols] = np.where(mask, P[..., rows, cols], I)
+	return PSI, npoints
+
+# Bilinear interpolation in the cells (u0, u1) x (v0, v1) of the grids P,
+# at the fractions TU, TV of each cell
+def bilinear(P, u0, u1, v0, v1, TU, TV):
+	return (1 - TV)*((1 - TU)*P[..., v0, u0] + TU*P[..., v0, u1]) + \
+           TV*((1 - TU)*P[..., v1, u0] + TU*P[..., v1, u1])
+
+# Calculate all jobs on one tile and store them in the PSI grids
+def calc_tile(ARGS, PSI, GT, index):
+	SHELLS, L, M, N, R, NN, JOBS, CS, BF, thresh = ARGS
+	AO_List = calc_AOs(SHELLS, L, M, N, R, NN, GT, thresh, BF)
+	shape = grid_shape(GT)
+	for n in range(len(JOBS)):
+		PHI = (CS[n] @ AO_List).reshape(len(CS[n]), *shape)
+		PSI[n][index] = job_result(JOBS[n], PHI)
+
+# Worker processes: the read-only inputs are inherited when the process
+# is forked, and the results are written into shared memory
+WORKER = {}
+
+def init_worker(ARGS, PSI):
+	WORKER["ARGS"] = ARGS
+	WORKER["PSI"]  = PSI
+
+def tile_worker(item):
+	calc_tile(WORKER["ARGS"], WORKER["PSI"], *item)
+	return True
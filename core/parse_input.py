@@ -1,17 +1,27 @@
 #! /usr/bin/env python3
 # GPFPlot Library for Parsing Input File
-# Last modified: 2021-10-20
+# Last modified: 2026-10-18
+
+import numpy as np
 
 MORB = ["ORB","HFORB"]
 DENS = ["QC","INT","TOT"]
 MISC = ["PROMPT"]
 MODES= MORB + DENS + MISC
 
-def getLine(source, string, pos=0, none=True, comments=True):
+def getLine(source, string, pos=0, none=True, comments=True,
+            sections=None):
 	"""Get the line index of the ($pos+1)-th
-       occurrence of $string in $source."""
+       occurrence of $string in $source.
+       If the $sections of $source (see index_sections) have a
+       key contained in $string, only its lines are searched."""
+	lines = range(len(source))
+	if sections is not None:
+		keys = [key for key in sections if key in string]
+		if keys:
+			lines = sections[max(keys, key=len)]
 	count=0
-	for index in range(len(source)):
+	for index in lines:
 		if string in source[index]:
 			if source[index][0] == "#":
 				continue # Ignore comments
@@ -23,17 +33,49 @@ def getLine(source, string, pos=0, none=True, comments=True):
 	else:
 		raise ValueError('string not found')
 
+def index_sections(source, keys):
+	"""Line indexes of all occurrences of each of $keys
+       in $source, found with a single pass for each key
+       over the whole text instead of one per getLine call."""
+	text = "\n".join(source)
+	# position of the first character of each line in text
+	length = np.fromiter(map(len, source), dtype=np.int64,
+                         count=len(source)) + 1
+	starts = np.cumsum(length) - length
+	sections = {}
+	for key in keys:
+		found = []
+		at = text.find(key)
+		while at >= 0:
+			found.append(at)
+			at = text.find(key, at + 1)
+		sections[key] = np.unique(np.searchsorted(starts, found,
+                                  side='right') - 1).tolist()
+	return sections
+
+# Orbitals of a mode (list of words) are valid for NC VB and NHF HF
+# orbitals
+def check_mode(mode, NC, NHF):
+	try:
+		orbs = list(map(int, mode[1:]))
+	except ValueError:
+		return False
+	if mode[0] in MORB and len(orbs) != 1:
+		return False
+	n = NHF if mode[0] == "HFORB" else NC
+	return len(orbs) > 0 and all(1 <= i <= n for i in orbs)
+
 def truefalse(s):
   return s.lower() in ("yes", "true", "t", "y", "1")
 
 def parse(file, string, default=""):
-	try:
-		# string+"=" prevents finding variables instead of values 
-		line = getLine(file, string+"=")
-		result = file[line].split("=")[1]
-	except:
-		result = default
-	return result	
+	# only lines starting with string+"=": a key is never found inside
+	# another one (c_tol in occ_tol, cache in orb_cache) nor in a value,
+	# and comments are skipped
+	for line in file:
+		if line.lstrip().startswith(string + "="):
+			return line.split("=")[1]
+	return default
 
 def parse1(infile):
 	out_file  = parse(infile,  "out_file")
@@ -46,7 +88,19 @@ def parse2(infile):
 	gridp = int( parse(infile, "gridp", "50"))
 	Xlim = tuple( map(float, parse(infile, "xlim", "-1,1").split(",")))
 	Ylim = tuple( map(float, parse(infile, "ylim", "-1,1").split(",")))
-	offset = float( parse(infile, "offset", "0"))
+	offset = parse(infile, "offset", "0")
+	if ":" in offset: # sweep start:stop:step, stop included
+		start, stop, step = map(float, offset.split(":"))
+		if step == 0 or (stop - start)/step < 0:
+			print(" ERROR: Invalid offset sweep (step must be nonzero,"
+                  " from start towards stop).")
+			exit(1)
+		n = int(round((stop - start)/step)) + 1
+		offset = tuple((start + step*np.arange(n)).tolist())
+		if n == 1: # a single plane
+			offset = offset[0]
+	else:
+		offset = float(offset)
 	return plane, gridp, Xlim, Ylim, offset
 
 def parse3(infile, mode):
@@ -96,6 +150,26 @@ def parse3_prompt(infile, c_fill, color_f, c_lines, color_l, c_label,\
            min_c, max_c, nconts, auto_c,\
            p_unit, draw_atom, draw_name, title
 
+def parse2_prompt(infile, plane, gridp, Xlim, Ylim, offset):
+	"""
+	Perform parse2 again in PROMPT mode (the plane is kept). Default
+	values for all variables are their previously set values.
+	"""
+	try:
+		gridp1 = int( parse(infile, "gridp", str(gridp)))
+		Xlim1 = tuple( map(float, parse(infile, "xlim",
+                                        ",".join(map(repr, Xlim))).split(",")))
+		Ylim1 = tuple( map(float, parse(infile, "ylim",
+                                        ",".join(map(repr, Ylim))).split(",")))
+		# offset sweeps (start:stop:step) are not available here
+		offset1 = float( parse(infile, "offset", repr(offset)))
+		if gridp1 < 2 or len(Xlim1) != 2 or len(Ylim1) != 2:
+			raise ValueError()
+	except ValueError: # the grid is kept
+		print("Invalid gridp, xlim, ylim or offset! The grid is not changed.")
+		return plane, gridp, Xlim, Ylim, offset
+	return plane, gridp1, Xlim1, Ylim1, offset1
+
 def parse4(infile):
 	save_list = parse(infile,  "save_png").split(" ")
 	if len(save_list) == 0:
@@ -116,4 +190,29 @@ def parse4(infile):
 	else:
 		dpieps = 300
 	save_txt = parse(infile, "save_txt")
-	return save_png, save_eps, dpipng, dpieps, save_txt
+	save_npy = parse(infile, "save_npy")
+	return save_png, save_eps, dpipng, dpieps, save_txt, save_npy
+
+def parse5(infile):
+	screen = float( parse(infile, "screen", "1e-10"))
+	c_tol  = float( parse(infile, "c_tol", "0"))
+	tile   = int( parse(infile, "tile", "0"))
+	nprocs = int( parse(infile, "nprocs", "1"))
+	cache  = truefalse( parse(infile, "cache", "yes"))
+	natural = truefalse( parse(infile, "natural", "no"))
+	occ_tol = float( parse(infile, "occ_tol", "0"))
+	orb_cache = float( parse(infile, "orb_cache", "1000"))
+	prefetch = truefalse( parse(infile, "prefetch", "yes"))
+	progressive = truefalse( parse(infile, "progressive", "no"))
+	adaptive = float( parse(infile, "adaptive", "0"))
+	return screen, c_tol, tile, nprocs, cache, natural, occ_tol,\
+           orb_cache, prefetch, progressive, adaptive
+
+def parse6(infile):
+	Wlim = tuple( map(float, parse(infile, "wlim", "-1,1").split(",")))
+	save_cube = parse(infile, "save_cube")
+	save_vol = parse(infile, "save_vol")
+	anim_list = parse(infile, "save_anim").split(" ")
+	save_anim = anim_list[0]
+	fps = float(anim_list[1]) if len(anim_list) > 1 else 2.
+	return Wlim, save_cube, save_vol, save_anim, fps
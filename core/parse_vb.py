@@ -1,10 +1,11 @@
 #! /usr/bin/env python3
 # GPFPlot Library for Parsing Input Files
-# Last modified: 2020-07-09
+# Last modified: 2026-10-18
 
+import numpy as np
 from math import ceil
-from core.parse_input import getLine
-from core.operations import RAng
+from core.parse_input import getLine, index_sections
+from core.operations import RAng, group_matrix
 # Parameters ###########################################################
 # basis functions per shell type
 ShellSize = {"S" : 1, "P" : 3, "L" : 4, "D" : 6, "F" : 10, "G" : 15,
@@ -34,13 +35,48 @@ LMN = [\
 ShellIndex = {"S" : 0, "P" : 1, "L" : 2, "D" : 3,
               "F" : 4, "G" : 5, "H" : 6, "I" : 7}
 
+# section headers searched by the parsers (see index_sections)
+SECTIONS = [" TOTAL NUMBER OF ATOMS", " ATOM      ATOMIC",
+            "THE POINT GROUP OF THE MOLECULE IS",
+            "ATOMIC BASIS SET", "TOTAL NUMBER OF BASIS",
+            "NUMBER OF CARTESIAN", " NUMBER OF ELECTRONS",
+            " Number of electron groups", " Num. of electron",
+            " Num. of orbital", " Method# ", "ORBITALS OF EACH ELECTRON",
+            "KEPT IN THE VARIATION SPACE IS", "MOLECULAR ORBITALS",
+            "EIGENVECTORS", "OVERLAP MATRIX OF VB ORBITALS FOR GROUP",
+            "ONE-ELECTRON DENSITY MATRIX - GROUP"]
+
 # Functions ############################################################
-def parse_geom(jobtext):
+def read_block(jobtext, line, nlines, ncols, col=16):
+	"""
+	Read a block of nlines x ncols numbers starting at
+	jobtext[line][col:], converting all of them at once."""
+	text = " ".join([ln[col:] for ln in jobtext[line : line + nlines]])
+	block = np.fromstring(text, sep=" ")
+	if block.size != nlines*ncols:
+		raise ValueError("unexpected block format at line %d" %(line+1))
+	return block.reshape(nlines, ncols)
+
+def read_fixed(jobtext, line, nlines, ncols, col, width):
+	"""
+	Split a block of nlines lines into ncols fixed-width fields
+	starting at jobtext[line][col:]. Returns a (nlines, ncols) array
+	of byte strings, blank where a line is shorter than the block."""
+	size = ncols*width
+	text = "".join([ln[col : col + size].rstrip("\r\n").ljust(size)
+                    for ln in jobtext[line : line + nlines]])
+	if len(text) != nlines*size:
+		raise ValueError("unexpected block format at line %d" %(line+1))
+	block = np.frombuffer(text.encode("ascii"), dtype="S%d" %width)
+	return block.reshape(nlines, ncols)
+
+def parse_geom(jobtext, sections=None):
 	""" Get geometric parameters.""" 
-	line = getLine(jobtext," TOTAL NUMBER OF ATOMS                    ")
+	line = getLine(jobtext," TOTAL NUMBER OF ATOMS                    ",
+                   sections=sections)
 	NATOMS = int( jobtext[line].split()[-1] )
 
-	line = getLine(jobtext," ATOM      ATOMIC")
+	line = getLine(jobtext," ATOM      ATOMIC", sections=sections)
 	unit = jobtext[line].split()[-1][1:-1]
 
 	LATOMS = []
@@ -60,15 +96,16 @@ def parse_geom(jobtext):
 
 	return NATOMS, CHARGE, LATOMS, COORD
 
-def get_symm(jobtext):
+def get_symm(jobtext, sections=None):
 	"""
 	Get point group symmetry of the molecule
 	in order to fix the basis set."""
-	ln = getLine(jobtext, "THE POINT GROUP OF THE MOLECULE IS")
+	ln = getLine(jobtext, "THE POINT GROUP OF THE MOLECULE IS",
+                 sections=sections)
 	pg = jobtext[ln].split()[-1]
 	return pg
 
-def parse_basis(jobtext):
+def parse_basis(jobtext, sections=None):
 	""" Get basis set parameters. """
 	L = []; M = []; N = [] 	# exponents for x, y, z
 	A = []             		# exponent of (r-R)^2
@@ -76,8 +113,8 @@ def parse_basis(jobtext):
 	CC = []             	# contraction coefficients
 	IATOM2 = []             # which atom (name) - fix symmetry problem
 
-	li = getLine(jobtext, "ATOMIC BASIS SET")+7
-	lf = getLine(jobtext, "TOTAL NUMBER OF BASIS")
+	li = getLine(jobtext, "ATOMIC BASIS SET", sections=sections)+7
+	lf = getLine(jobtext, "TOTAL NUMBER OF BASIS", sections=sections)
 	atomcount = 0
 	currentshell = 0
 
@@ -159,16 +196,19 @@ def fix_basis(L, M, N, A, IATOM, LABELS, NEW_LABELS, CC):
 	return new_L, new_M, new_N, new_A, new_IATOM, new_CC
 
 
-def	parse_gpf(jobtext):
-	line = getLine(jobtext, "NUMBER OF CARTESIAN GAUSSIAN BASIS FUNCT")
+def	parse_gpf(jobtext, sections=None):
+	line = getLine(jobtext, "NUMBER OF CARTESIAN GAUSSIAN BASIS FUNCT",
+                   sections=sections)
 	NBF = int(jobtext[line].split()[-1])
-	line = getLine(jobtext, " NUMBER OF ELECTRONS                    ")
+	line = getLine(jobtext, " NUMBER OF ELECTRONS                    ",
+                   sections=sections)
 	NELS = int(jobtext[line].split()[-1])
-	line = getLine(jobtext," Number of electron groups       =")
+	line = getLine(jobtext," Number of electron groups       =",
+                   sections=sections)
 	NGROUPS = int(jobtext[line].split()[-1])
-	line = getLine(jobtext," Num. of electron")
+	line = getLine(jobtext," Num. of electron", sections=sections)
 	EL_GROUP = list(map(int, jobtext[line].split()[3:]))
-	line = getLine(jobtext," Num. of orbital")
+	line = getLine(jobtext," Num. of orbital", sections=sections)
 	ORB_GROUP = list( map(int, jobtext[line].split()[3:]))
 	NORBS = sum(ORB_GROUP)
 
@@ -178,15 +218,15 @@ def	parse_gpf(jobtext):
 		GROUP_LAYOUT.append(list(range(count, ORB_GROUP[i] + count )))
 		count += ORB_GROUP[i]
 
-	line = getLine(jobtext," Method# ")
+	line = getLine(jobtext," Method# ", sections=sections)
 	hf_group = int(jobtext[line].split()[1])
 
 	# If SPHER is set an extra group with Method#=99 is created and
 	# the overlaps are not printed
-	line = getLine(jobtext," Method# ")
 	g99 = jobtext[line].split()[-1] == "99"
 
-	lo = getLine(jobtext, "ORBITALS OF EACH ELECTRON")+6
+	lo = getLine(jobtext, "ORBITALS OF EACH ELECTRON",
+                 sections=sections)+6
 	ncols=6
 	space=6
 
@@ -197,27 +237,25 @@ def	parse_gpf(jobtext):
 	if NORBS % ncols != 0: Nl[-1] = NORBS % ncols
 
 	# Extract the orbital coefficients
-	C   = []
+	C   = np.empty([NORBS, NBF])
 	for i in range(Ns):
-		for j in range(Nl[i]):
-			C.append([])
-			for k in range(NBF):
-				orbs = jobtext[lo+k][16:].split()
-				C[j + ncols*i].append(float(orbs[j])) 
+		block = read_block(jobtext, lo, NBF, Nl[i])
+		C[ncols*i : ncols*i + Nl[i]] = block.T
 		lo += NBF + space # pass to next horizontal set of orbitals
 	return NBF, GROUP_LAYOUT, C, hf_group, g99
 
-def	parse_hf(jobtext, NBF):
+def	parse_hf(jobtext, NBF, sections=None):
 	try:
 		ln = getLine(jobtext, "KEPT IN THE VARIATION SPACE IS",
-                     none=False)
+                     none=False, sections=sections)
 	except:
-		ln = getLine(jobtext, "NUMBER OF CARTESIAN", none=False)
+		ln = getLine(jobtext, "NUMBER OF CARTESIAN", none=False,
+                     sections=sections)
 	NORBS = int( jobtext[ln].split()[-1] ) # number of orbitals
 	try:
-		lo = getLine(jobtext, "MOLECULAR ORBITALS")+6
+		lo = getLine(jobtext, "MOLECULAR ORBITALS", sections=sections)+6
 	except:
-		lo = getLine(jobtext, "EIGENVECTORS")+6
+		lo = getLine(jobtext, "EIGENVECTORS", sections=sections)+6
 
 	ncols=5
 	space=4
@@ -227,30 +265,20 @@ def	parse_hf(jobtext, NBF):
 	Nl = [ncols]*Ns
 	if NORBS % ncols != 0: Nl[-1] = NORBS % ncols
 	# Extract the orbital coefficients
-	C   = []
+	C   = np.empty([NORBS, NBF])
 	for i in range(Ns):
-		for j in range(Nl[i]):
-			C.append([])
-			for k in range(NBF):
-				orbs = jobtext[lo+k][16:].split()
-				C[j + ncols*i].append(float(orbs[j])) 
+		block = read_block(jobtext, lo, NBF, Nl[i])
+		C[ncols*i : ncols*i + Nl[i]] = block.T
 		lo += NBF + space # pass to next horizontal set of orbitals
 	return C
 
-def parse_overlaps(jobtext, hf, GL):
-	NO=GL[-1][-1] + 1	# number of orbitals
+def parse_overlaps(jobtext, hf, GL, sections=None):
+	""" Overlap matrix of the VB orbitals, as a group matrix."""
 	NG = len(GL)  		# number of groups
+	if sections is None:
+		sections = index_sections(jobtext, SECTIONS)
 
-#	#OVERLAPS=[] #np.identity(NO)
-	OVERLAPS=[]
-	for i in range(NO):
-		OVERLAPS.append([])
-		for j in range(NO):
-			if i == j:
-				OVERLAPS[i].append(1.0)
-			else:
-				OVERLAPS[i].append(0.0)	
-
+	BLOCKS = [np.identity(len(G)) for G in GL]
 	if hf == 1: # no HF group
 		start = 1
 	else:
@@ -258,56 +286,61 @@ def parse_overlaps(jobtext, hf, GL):
 	for i in range(start, NG):
 		line = getLine(jobtext,
                      "OVERLAP MATRIX OF VB ORBITALS FOR GROUP  {0:2d}".\
-                     format(i+1)) + 5
-		for j in range(len(GL[i]) - 1):
-			for k in range(j+1):
-				OVERLAPS[GL[i][j + 1]][GL[i][k]]\
-                         = float(jobtext[line][4 + 7*k : 11 + 7*k])
-				OVERLAPS[GL[i][k]][GL[i][j + 1]]\
-                         = float(jobtext[line][4 + 7*k : 11 + 7*k])
-			#end
-			line+=1
-		#end
+                     format(i+1), sections=sections) + 5
+		n = len(GL[i]) - 1
+		if n < 1: continue
+		# strictly lower triangle: row j+1 holds columns 0..j
+		block = read_fixed(jobtext, line, n, n, 4, 7)
+		low = np.tril_indices(n)
+		S = np.zeros([n+1, n+1])
+		S[1:, :-1][low] = block[low].astype(float)
+		BLOCKS[i] += S + S.T
 	#end
-	return OVERLAPS	
+	return group_matrix(GL, BLOCKS)
 
-def parse_dmatrix(jobtext, GL):
-	NO=GL[-1][-1] + 1	# number of orbitals
+def parse_dmatrix(jobtext, GL, sections=None):
+	""" One-electron density matrix, as a group matrix."""
 	NG = len(GL)  		# number of groups
+	if sections is None:
+		sections = index_sections(jobtext, SECTIONS)
 
-	#DMATRIX= np.zeros([NO,NO])
-	DMATRIX=[]
-	for i in range(NO):
-		DMATRIX.append([])
-		for j in range(NO):
-			DMATRIX[i].append(0.0)	
-
+	BLOCKS = [np.zeros([len(G), len(G)]) for G in GL]
 	for i in range(NG):
 		line = getLine(jobtext,
                        "ONE-ELECTRON DENSITY MATRIX - GROUP   {:3d}".\
-                       format(i+1)) + 3
-		if len(GL[i]) <= 10:
-			for j in range(len(GL[i])):
-				for k in range(len(GL[i])):
-					DMATRIX[GL[i][j]][GL[i][k]]\
-                            = float(jobtext[line][3 + 13*k : 16 + 13*k])
-				#end
-				line += 1
-			#end
-		# different format for groups > 10 orbitals
-		else:
-			worklist = [10]*(len(GL[i])//10)
-			worklist.append(len(GL[i]) % 10)
-			for w in range(len(worklist)):
-				for j in range(len(GL[i]) - 10*w):
-					for k in range(worklist[w]):
-						DMATRIX[GL[i][j + 10*w]][GL[i][k + 10*w]]\
-		                    = float(jobtext[line][3 + 13*k : 16 + 13*k])
-					#end
-					line += 1
-				#end
-				line += 2
-			#end
-		#end			
+                       format(i+1), sections=sections) + 3
+		n = len(GL[i])
+		# groups > 10 orbitals are printed in chunks of 10 columns,
+		# each one starting at the diagonal and separated by 2 lines
+		for c0 in range(0, n, 10):
+			nc = min(10, n - c0)
+			block = read_fixed(jobtext, line, n - c0, nc, 3, 13)
+			BLOCKS[i][c0:, c0:c0+nc] = block.astype(float)
+			line += n - c0 + 2
+		#end
 	#end
-	return DMATRIX
+	return group_matrix(GL, BLOCKS)
+
+def parse_out(jobtext):
+	"""
+	Parse everything GPFPlot needs from a GAMESS/VB2000 output.
+	OVERLAPS is None if the overlap matrices are not found."""
+	# the sections are located once, with a single pass over jobtext
+	S = index_sections(jobtext, SECTIONS)
+	NATOMS, CHARGE, ATOMS, R = parse_geom(jobtext, S)
+	L, M, N, A, IATOM, IATOM2, CC = parse_basis(jobtext, S)
+
+	if len(IATOM2) != NATOMS: #  symmetry issues with basis set
+		L, M, N, A,\
+        IATOM, CC = fix_basis(L, M, N, A, IATOM, IATOM2, ATOMS, CC)
+
+	NBF, GL, C, hf, g99 = parse_gpf(jobtext, S)
+	CHF = parse_hf(jobtext, NBF, S)
+
+	# the group with Method#=99 has no overlaps
+	try:
+		OVERLAPS = parse_overlaps(jobtext, hf, GL[:-1] if g99 else GL, S)
+	except:
+		OVERLAPS = None
+	return NATOMS, CHARGE, ATOMS, R, L, M, N, A, IATOM, CC,\
+           NBF, GL, C, hf, g99, CHF, OVERLAPS
@@ -1,11 +1,13 @@
 #! /usr/bin/env python3
 # GPFPlot Library for Plotting Utilities
-# Last modified: 2020-07-09
+# Last modified: 2026-10-18
 #
 import numpy as np
 from matplotlib.pyplot import colorbar
 import matplotlib.cm as cm
+from matplotlib.animation import PillowWriter, FFMpegWriter
 from core.operations import RAng
+from core.grid_files import save_txt, save_npy
 
 def Plot_Settings(ATOMS, NATOMS, R,
                   draw_atom, plane, offset,
@@ -102,3 +104,73 @@ def Plot_Function(plt, c_fill, color_f, c_lines, color_l, c_label,
 			else:
 				plt.plot(Atom_posx[i], Atom_posy[i], 'ko')
 #end
+
+# Planes of a plot: (offset, grid, suffix of the output files) of the
+# single plane, or of each plane of an offset sweep (NAME_001, ...)
+def Sweep_Slices(offset, PSI):
+	if np.ndim(offset) == 0:
+		return [(offset, PSI, "")]
+	return [(w, PSI[k], "_{0:03d}".format(k + 1))
+            for k, w in enumerate(offset)]
+
+# Title of the plane k of SLICES: that of the sweep planes ends with
+# their offset
+def Slice_Title(fig, title, plane, SLICES, k):
+	if len(SLICES) > 1:
+		offplane = 'xyz'.replace(plane[0], "").replace(plane[1], "")
+		fig.suptitle("{0}{1} = {2:.3f} bohr".format(
+                     title + "   " if title != "" else "", offplane,
+                     SLICES[k][0]), fontsize=16)
+	elif title != "":
+		fig.suptitle(title, fontsize=16)
+
+def Save_Slices(fig, SLICES, plot_slice, title, plane, label, FILES, INFO):
+	"""
+	Plot each plane of SLICES (see Sweep_Slices) with plot_slice(k),
+	unless it is None (already plotted), and save it. FILES = (save_png,
+	save_eps, dpipng, dpieps, save_txt, save_npy, save_anim, fps), ""
+	for the files not saved: the animation has the planes of a sweep as
+	frames. INFO = (version, out_file, dens_file, gpf_file, mode, Xlim,
+	Ylim, gridp), for the txt and npy files."""
+	save_png, save_eps, dpipng, dpieps,\
+	save_txt_, save_npy_, save_anim, fps = FILES
+	version, out_file, dens_file, gpf_file, mode, Xlim, Ylim, gridp = INFO
+
+	# the animation of a sweep is written frame by frame
+	writer = None
+	if save_anim != "" and len(SLICES) > 1:
+		if save_anim.endswith(".gif"):
+			writer = PillowWriter(fps=fps)
+		else:
+			writer = FFMpegWriter(fps=fps)
+		writer.setup(fig, save_anim)
+
+	for k, (w, PSI, suffix) in enumerate(SLICES):
+		if plot_slice is not None:
+			plot_slice(k)
+			Slice_Title(fig, title, plane, SLICES, k)
+			print(" {0} plotted{1}.".format(label, ", offset = {0}".\
+                  format(w) if len(SLICES) > 1 else ""))
+		if writer is not None: writer.grab_frame()
+
+		if save_png != "":
+			fig.savefig(save_png+suffix+".png", dpi=dpipng)
+			print(" {0}.png plotted.".format(save_png+suffix))
+
+		if save_eps != "":
+			fig.savefig(save_eps+suffix+".eps", dpi=dpieps)
+			print(" {0}.eps plotted.".format(save_eps+suffix))
+
+		if save_txt_ != "":
+			save_txt(save_txt_+suffix, version, out_file, dens_file,
+                     gpf_file, mode, plane, Xlim, Ylim, w, gridp, PSI)
+			print(" {0}.txt saved.".format(save_txt_+suffix))
+
+		if save_npy_ != "":
+			save_npy(save_npy_+suffix, version, out_file, dens_file,
+                     gpf_file, mode, plane, Xlim, Ylim, w, gridp, PSI)
+			print(" {0}.npy saved.".format(save_npy_+suffix))
+
+	if writer is not None:
+		writer.finish()
+		print(" {0} saved.".format(save_anim))
@@ -0,0 +1,276 @@
+#! /usr/bin/env python3
+# GPFPlot Library for the PROMPT Mode
+# Last modified: 2026-10-18
+#
+# Orbital grids are calculated when first needed and kept in a cache
+# with a memory budget: when it is exceeded, the least recently used
+# grids are dropped (and calculated again if needed later). The
+# densities calculated from them are kept in the same cache.
+#
+# When the grid changes (zoom, pan), only the orbitals of the last plot
+# are moved to the new grid: the points shared by the old and the new
+# grids are kept and only the others are calculated. The other orbitals
+# are dropped, and calculated again by the background worker if any.
+#
+# The calculations can be done by a background thread, which, while the
+# prompt is idle, calculates the orbitals most likely to be needed next.
+
+import numpy as np
+from collections import OrderedDict
+from itertools import count
+from queue import PriorityQueue
+from threading import Thread, Event, Lock
+from core.operations import calc_psi, calc_stage, grid_strides, job_orbs,\
+                            grid_shape
+
+def orbital_cache(SHELLS, L, M, N, R, NN, GRID, C, CHF,
+                  screen=0., c_tol=0., tile=0, nprocs=1, budget=1000.):
+	# budget = memory for the grids, in MB
+	return dict(calc=(SHELLS, L, M, N, R, NN, GRID),
+                opts=(screen, c_tol, tile, nprocs),
+                C={"VB": C, "HF": CHF}, lock=Lock(),
+                GRIDS=OrderedDict(), size=0, budget=budget*2**20)
+
+# Get (and mark as most recently used) or store grids of the cache.
+# Keys are (kind, norb) for orbitals and (mode, OSET) for densities.
+def cache_get(CACHE, key):
+	with CACHE["lock"]:
+		if key not in CACHE["GRIDS"]:
+			return None
+		CACHE["GRIDS"].move_to_end(key)
+		return CACHE["GRIDS"][key]
+
+def cache_put(CACHE, key, grid):
+	GRIDS = CACHE["GRIDS"]
+	with CACHE["lock"]:
+		if key in GRIDS:
+			CACHE["size"] -= GRIDS[key].nbytes
+		GRIDS[key] = grid
+		CACHE["size"] += grid.nbytes
+		# drop the least recently used grids, but never the new one
+		while CACHE["size"] > CACHE["budget"] and len(GRIDS) > 1:
+			old, grid = GRIDS.popitem(last=False)
+			CACHE["size"] -= grid.nbytes
+
+# screen, c_tol, tile, nprocs for calc_psi. With the background worker,
+# an untiled grid is split into 4 x 4 tiles, the points where its
+# calculations can be interrupted.
+def calc_opts(CACHE, GRID):
+	screen, c_tol, tile, nprocs = CACHE["opts"]
+	if tile <= 0 and nprocs <= 1 and "tasks" in CACHE:
+		tile = -(-max(grid_shape(GRID)[-2:])//4)
+	return screen, c_tol, tile, nprocs
+
+def get_orbitals(CACHE, kind, norbs, progress=None):
+	"""
+	Grids of the orbitals norbs (by index, starting at 0) of kind "VB"
+	or "HF", as a dict {norb: grid}. The missing ones are calculated
+	together, with a single evaluation of the AOs (see calc_psi for
+	progress)."""
+	PHI = {}
+	for i in sorted(set(norbs)):
+		PHI[i] = cache_get(CACHE, (kind, i))
+	new = [i for i in PHI if PHI[i] is None]
+	if new != []:
+		SHELLS, L, M, N, R, NN, GRID = CACHE["calc"]
+		JOB = job_orbs(CACHE["C"][kind], new)
+		GRIDS = calc_psi(SHELLS, L, M, N, R, NN, GRID, [JOB],
+                         *calc_opts(CACHE, GRID), progress=progress)[0]
+		for i, grid in zip(new, GRIDS):
+			# a copy, so that dropping it frees its memory
+			PHI[i] = grid.copy()
+			cache_put(CACHE, (kind, i), PHI[i])
+	return PHI
+
+def staged_orbitals(CACHE, kind, norbs, progressive=True):
+	"""
+	Same as fetch_orbitals, but the missing orbitals are calculated in
+	stages of decreasing stride (see grid_strides). Yields (s, PHI) after
+	each stage, PHI having the grids on every s-th point of each axis;
+	the last stage (s = 1) gives the full grids, which go to the cache."""
+	SHELLS, L, M, N, R, NN, GRID = CACHE["calc"]
+	OLD = {i: cache_get(CACHE, (kind, i)) for i in sorted(set(norbs))}
+	new = [i for i in OLD if OLD[i] is None]
+	strides = grid_strides(GRID)
+	if not progressive or new == [] or len(strides) == 1:
+		yield 1, fetch_orbitals(CACHE, kind, norbs)
+		return
+	JOB = job_orbs(CACHE["C"][kind], new)
+	NEW = [np.zeros((len(new),) + grid_shape(GRID))]
+	prev = 0
+	for s in strides:
+		run_task(CACHE, lambda progress:
+                 calc_stage(SHELLS, L, M, N, R, NN, GRID, [JOB], NEW, s, prev,
+                            *calc_opts(CACHE, GRID), progress=progress))
+		prev = s
+		PHI = {i: grid[::s, ::s] for i, grid in OLD.items() if i not in new}
+		for i, grid in zip(new, NEW[0]):
+			PHI[i] = grid[::s, ::s]
+		yield s, PHI
+	for i, grid in zip(new, NEW[0]):
+		cache_put(CACHE, (kind, i), grid.copy())
+
+# Index in A0 of each value of the grid axis A1, -1 if it is not in A0
+def match_axis(A0, A1):
+	A0, A1 = np.asarray(A0), np.asarray(A1)
+	tol = 1e-10*max(np.abs(A0).max(), np.abs(A1).max(), 1.)
+	order = np.argsort(A0)
+	k = np.clip(np.searchsorted(A0[order], A1), 1, len(A0) - 1)
+	k = np.where(np.abs(A0[order][k - 1] - A1) <= np.abs(A0[order][k] - A1),
+                 k - 1, k)
+	return np.where(np.abs(A0[order][k] - A1) <= tol, order[k], -1)
+
+def regrid(CACHE, GRID, keep=(), progress=None):
+	"""
+	Move the cache to a new grid of the same plane. The orbitals in keep,
+	[(kind, norbs), ...], are kept if they are in the cache: their values
+	at the points of the old grid are reused and only the new points are
+	calculated. The other orbitals and the densities are dropped (they
+	are calculated again if needed, or warmed up by the worker)."""
+	SHELLS, L, M, N, R, NN, GRID0 = CACHE["calc"]
+	plane0, U0, V0, W0 = GRID0
+	plane, U, V, W = GRID
+	KEEP = set((kind, i) for kind, norbs in keep for i in norbs)
+	with CACHE["lock"]:
+		OLD = [(key, grid) for key, grid in CACHE["GRIDS"].items()
+               if key in KEEP]
+	iu, iv = match_axis(U0, U), match_axis(V0, V)
+	mu, mv = iu >= 0, iv >= 0
+	if plane != plane0 or not np.allclose(W0, W) or \
+       not mu.any() or not mv.any():
+		OLD = [] # nothing in common
+	# the new points: rows not in the old grid, and then the columns not
+	# in the old grid of the remaining rows
+	PARTS = [(~mv, np.ones(len(U), bool)), (mv, ~mu)]
+	PARTS = [(rows, cols) for rows, cols in PARTS if rows.any() and cols.any()]
+
+	NEW = []
+	for kind in CACHE["C"]:
+		OLDPHI = [grid for key, grid in OLD if key[0] == kind]
+		norbs = [key[1] for key, grid in OLD if key[0] == kind]
+		if norbs == []:
+			continue
+		PHI = np.empty((len(norbs), len(V), len(U)))
+		for k in range(len(norbs)):
+			PHI[k][np.ix_(mv, mu)] = OLDPHI[k][np.ix_(iv[mv], iu[mu])]
+		for rows, cols in PARTS:
+			G = (plane, U[cols], V[rows], W)
+			JOB = job_orbs(CACHE["C"][kind], norbs)
+			PHI[np.ix_(range(len(norbs)), rows, cols)] = \
+                   calc_psi(SHELLS, L, M, N, R, NN, G, [JOB],
+                            *calc_opts(CACHE, G), progress=progress)[0]
+		NEW += [((kind, i), grid.copy()) for i, grid in zip(norbs, PHI)]
+
+	# nothing is changed until all the new points are calculated
+	with CACHE["lock"]:
+		CACHE["calc"] = (SHELLS, L, M, N, R, NN, GRID)
+		CACHE["GRIDS"].clear()
+		CACHE["size"] = 0
+	for key, grid in NEW:
+		cache_put(CACHE, key, grid)
+	# warm up again
+	if "tasks" in CACHE:
+		for kind, norbs in CACHE["warm"]:
+			CACHE["tasks"].put((1, next(CACHE["count"]), kind, norbs,
+                                None))
+
+# Background worker ####################################################
+class Cancelled(Exception):
+	pass
+
+def start_worker(CACHE, warm=()):
+	"""
+	Start the thread which does the calculations requested with
+	fetch_orbitals and change_grid. While there are no requests, it
+	calculates the batches of orbitals in warm, [(kind, norbs), ...],
+	as long as they fit in the memory budget."""
+	CACHE["tasks"] = PriorityQueue()
+	CACHE["count"] = count()
+	CACHE["urgent"] = Event() # a request is waiting
+	CACHE["cancel"] = Event() # the request was cancelled
+	CACHE["stop"] = Event() # the worker must finish (see stop_worker)
+	CACHE["warm"] = list(warm)
+	for kind, norbs in warm:
+		CACHE["tasks"].put((1, next(CACHE["count"]), kind, norbs, None))
+	CACHE["thread"] = Thread(target=worker, args=(CACHE,), daemon=True)
+	CACHE["thread"].start()
+
+# Stop the background worker, if it was started, and wait for it: the
+# calculation it is doing is interrupted at the end of the current tile.
+def stop_worker(CACHE):
+	if "tasks" not in CACHE:
+		return
+	CACHE["stop"].set()
+	CACHE["cancel"].set()
+	CACHE["tasks"].put((-1, next(CACHE["count"]), None, None, None))
+	CACHE["thread"].join()
+
+def worker(CACHE):
+	# warm up: give way to requests as soon as they arrive
+	def preempt(done, total):
+		if CACHE["urgent"].is_set() or CACHE["stop"].is_set():
+			raise Cancelled()
+
+	while True:
+		prio, n, kind, norbs, task = CACHE["tasks"].get()
+		if CACHE["stop"].is_set():
+			return
+		if task is None:
+			GRID = CACHE["calc"][-1]
+			npoints = int(np.prod(grid_shape(GRID)))
+			new = [i for i in norbs if (kind, i) not in CACHE["GRIDS"]]
+			if CACHE["size"] + 8*npoints*len(new) > CACHE["budget"]:
+				continue
+			try:
+				get_orbitals(CACHE, kind, new, preempt)
+			except Cancelled: # try again later
+				CACHE["tasks"].put((1, next(CACHE["count"]), kind,
+                                    norbs, None))
+			continue
+
+		CACHE["urgent"].clear()
+		def progress(done, total):
+			task["progress"] = (done, total)
+			if CACHE["cancel"].is_set():
+				raise Cancelled()
+		try:
+			task["result"] = task["run"](progress)
+		except Exception as error:
+			task["error"] = error
+		task["done"].set()
+
+# Run run(progress) in the background worker, if it was started: the
+# progress is printed while waiting, and Ctrl-C cancels the calculation
+# (KeyboardInterrupt is raised again once it stopped).
+def run_task(CACHE, run):
+	if "tasks" not in CACHE:
+		return run(None)
+	task = dict(run=run, done=Event(), progress=(0, 0))
+	CACHE["cancel"].clear()
+	CACHE["urgent"].set()
+	CACHE["tasks"].put((0, next(CACHE["count"]), None, None, task))
+	shown = False
+	try:
+		while not task["done"].wait(0.2):
+			done, total = task["progress"]
+			if total > 1:
+				print("\r Calculating orbitals... {0:3d}%".\
+                      format(100*done//total), end="", flush=True)
+				shown = True
+	except KeyboardInterrupt:
+		CACHE["cancel"].set()
+		task["done"].wait()
+		raise
+	finally:
+		if shown: print()
+	if "error" in task:
+		raise task["error"]
+	return task["result"]
+
+# get_orbitals and regrid, through the background worker
+def fetch_orbitals(CACHE, kind, norbs):
+	return run_task(CACHE, lambda progress:
+                    get_orbitals(CACHE, kind, norbs, progress))
+
+def change_grid(CACHE, GRID, keep=()):
+	run_task(CACHE, lambda progress: regrid(CACHE, GRID, keep, progress))
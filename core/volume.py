@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+# GPFPlot Library for Volume (3D) Grids
+# Last modified: 2026-10-18
+#
+# A volume is the box of the plot region times a range of the coordinate
+# perpendicular to the plane. It is calculated in slabs of a few slices
+# along that coordinate (a single calc_psi call each, so the in-plane
+# factors of the AOs and the process pool are shared by the slices of a
+# slab), and each slab is written to the output files as soon as it is
+# calculated: neither the AOs nor the results of the whole volume are
+# kept in memory.
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from core.operations import RAng, calcgrid, calc_psi, grid_shape,\
+                            plane_axes
+
+# Volume grid: the plane grid with W = gridp values in Wlim (in angstrom)
+def calcvolume(plane, Xlim, Ylim, Wlim, gridp):
+	X1, Y1, GRID = calcgrid(plane, Xlim, Ylim, gridp, 0.)
+	W = np.linspace(*Wlim, num=gridp)/RAng # convert to bohr!
+	return GRID[:3] + (W,)
+
+# Step (in bohr) of an evenly spaced axis
+def axis_step(A):
+	return (A[-1] - A[0])/(len(A) - 1) if len(A) > 1 else 0.
+
+# Header of a Gaussian cube file. The slowest axis of the data is W,
+# then V and U, so that each slice is a contiguous block of the file.
+def cube_header(f, title, GRID, NATOMS, CHARGE, R):
+	plane, U, V, W = GRID
+	iu, iv, iw = plane_axes(plane)
+	origin = [0.]*3
+	origin[iu], origin[iv], origin[iw] = U[0], V[0], W[0]
+	f.write(title + "\n")
+	f.write(" Generated by GPFPlot: plane {0}, slices along {1}\n".\
+            format(plane, "xyz"[iw]))
+	f.write("{0:5d}{1:12.6f}{2:12.6f}{3:12.6f}\n".format(NATOMS, *origin))
+	for A, k in ((W, iw), (V, iv), (U, iu)):
+		step = [0.]*3
+		step[k] = axis_step(A)
+		f.write("{0:5d}{1:12.6f}{2:12.6f}{3:12.6f}\n".format(len(A), *step))
+	# no atomic numbers in the output files: the nuclear charges are used
+	for i in range(NATOMS):
+		f.write("{0:5d}{1:12.6f}{2:12.6f}{3:12.6f}{4:12.6f}\n".format(
+                int(round(CHARGE[i])), CHARGE[i], R[0][i], R[1][i], R[2][i]))
+
+# One slice of a cube file: 6 values per line, each row of U on new lines
+def cube_slice(f, PSI):
+	nv, nu = PSI.shape
+	full, rest = divmod(nu, 6)
+	row = ("%13.5E"*6 + "\n")*full
+	if rest > 0:
+		row += "%13.5E"*rest + "\n"
+	f.write(row*nv % tuple(PSI.ravel()))
+
+def save_volume(SHELLS, L, M, N, R, NN, GRID, JOBS, NAMES, TITLES,
+                NATOMS, CHARGE, thresh=0., tol=0., tile=0, nprocs=1,
+                progress=None, slab=8):
+	"""
+	Calculate the jobs on the volume GRID (W being an array) and write
+	each one to NAMES[n] = (cube, vol), as the Gaussian cube file
+	cube.cube and/or the [W, V, U] array vol.npy ("" for none), with
+	the title TITLES[n] in the cube file. The volume is calculated in
+	slabs of slab slices; without a tile size, the tiles keep the memory
+	of a single slice. If given, progress(done, total) is called after
+	each slab."""
+	plane, U, V, W = GRID
+	FILES = []
+	for (cube, vol), title in zip(NAMES, TITLES):
+		f = None
+		if cube != "":
+			f = open(cube + ".cube", "w")
+			cube_header(f, title, GRID, NATOMS, CHARGE, R)
+		VOL = None
+		if vol != "":
+			VOL = open_memmap(vol + ".npy", mode="w+", dtype=float,
+                              shape=grid_shape(GRID))
+		FILES.append((f, VOL))
+
+	if tile <= 0 and nprocs <= 1:
+		tile = int(np.ceil(max(len(U), len(V))/np.sqrt(slab)))
+	try:
+		for k in range(0, len(W), slab):
+			WS = W[k : k + slab]
+			RES = calc_psi(SHELLS, L, M, N, R, NN, (plane, U, V, WS),
+                           JOBS, thresh, tol, tile, nprocs)
+			for (f, VOL), PSI in zip(FILES, RES):
+				if f is not None:
+					for P in PSI:
+						cube_slice(f, P)
+				if VOL is not None:
+					VOL[k : k + slab] = PSI
+			if progress is not None: progress(k + len(WS), len(W))
+	finally:
+		for f, VOL in FILES:
+			if f is not None:
+				f.close()
+			if VOL is not None:
+				VOL.flush()
@@ -15,40 +15,16 @@ __author__ = "David W. O. de Sousa"
 # Imports and functions ################################################
 import sys
 import matplotlib.pyplot as plt
+from matplotlib.animation import FuncAnimation
 from core.parse_input import *
 from core.parse_vb import *
+from core.cache import load_out
 from core.operations import *
+from core.prompt import *
+from core.volume import calcvolume, save_volume
 from core.plot_utils import *
 from shlex import split as ssplit
 
-def gen_txt(out_file, dens_file, gpf_file, mode,
-            plane, Xlim, Ylim, offset, gridp,
-            txt, PSI):
-	import os
-	from numpy import savetxt
-	from datetime import datetime
-
-	offplane = 'xyz'.replace( plane[0], "").replace( plane[1], "")
-	header ="""\
-Generated from GPF-PLOT version {0} at {1:%Y-%m-%d %H:%M:%S}
-GAMESS/VB2000 file:  {2}
-Density Matrix file: {3}
-GPF-PLOT input file: {4}
-{5}
-plane: {6}
-{7} range:  {8}
-{9} range:  {10}
-{11} offset: {12}
-gridpoints: {13}x{13}""".format(__version__, datetime.now(),
-                                os.path.abspath(out_file),
-                                os.path.abspath(dens_file),
-                                os.path.abspath(gpf_file), mode,
-                                plane, plane[0], Xlim, plane[1], Ylim,
-                                offplane, offset, gridp)
-	txt += ".txt"
-	np.savetxt(txt, PSI, fmt="%11.6f", delimiter="", header=header) 
-#end
-
 # Splash screen ########################################################
 print("""\
  *-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*
@@ -112,44 +88,58 @@ c_fill, color_f, c_lines, color_l, c_label,\
 min_c, max_c, nconts, auto_c,\
 p_unit, draw_atom, draw_name, title = parse3(infile, mode0)
 
-save_png, save_eps, dpipng, dpieps, save_txt = parse4(infile)
+save_png, save_eps, dpipng, dpieps, save_txt, save_npy = parse4(infile)
+
+# performance options input (can be overridden in the command line)
+screen, c_tol, tile, nprocs, cache, natural, occ_tol,\
+orb_cache, prefetch, progressive, adaptive = parse5(sys.argv[2:] + infile)
+if nprocs > 1 and not parallel_ok():
+	print(" Warning: nprocs > 1 is not available on this platform.")
+	nprocs = 1
+
+# volume (3D grid) and offset sweep options input
+Wlim, save_cube, save_vol, save_anim, fps = parse6(infile)
 ########################################################################
 # PROGRAM START
 
 # Parse input file
 print(" Loading input files...")
-jobfile = open(out_file,'r')
-jobtext = jobfile.readlines()
-
-NATOMS, CHARGE, ATOMS, R = parse_geom(jobtext)
-L, M, N, A, IATOM, IATOM2, CC = parse_basis(jobtext)
-
-if len(IATOM2) != NATOMS: #  symmetry issues with basis set
-	L, M, N, A,\
-    IATOM, CC = fix_basis(L, M, N, A, IATOM, IATOM2, ATOMS, CC)
-
-NBF, GL, C, hf, g99 = parse_gpf(jobtext)
-CHF = parse_hf(jobtext, NBF)
+NATOMS, CHARGE, ATOMS, R, L, M, N, A, IATOM, CC,\
+NBF, GL, C, hf, g99, CHF, OVERLAPS = load_out(out_file, cache)
+C, CHF = np.array(C), np.array(CHF)
 
 if dens_file != "":
+	if OVERLAPS is None:
+		print(" ERROR: Overlap matrices not found in " + out_file)
+		exit(1)
 	jobfile2 = open(dens_file,'r')
 	jobtext2 = jobfile2.readlines()
 	if g99: del(GL[-1])
-	OVERLAPS = np.array( parse_overlaps(jobtext, hf, GL) )
-	D_MATRIX = np.array( parse_dmatrix(jobtext2, GL) )
+	D_MATRIX = parse_dmatrix(jobtext2, GL)
 print()
 
+if mode0 == "PROMPT" and np.ndim(offset) > 0:
+	print(" Offset sweep not available in PROMPT mode: offset = {0}".\
+          format(offset[0]))
+	offset = offset[0]
+
 # Calculate orbitals
 print(" Calculating orbitals...")
-X1,Y1,Pxyz,Ri2=calcgrid(plane,Xlim,Ylim,gridp,offset, R, L,M,N, IATOM)
+X1,Y1,GRID=calcgrid(plane,Xlim,Ylim,gridp,offset)
 NN=NNorm(L,M,N,A,CC,NBF)
+SHELLS=make_shells(A, CC, IATOM)
 
-AO_List = calc_AOs(NBF, A, CC, Ri2, NN, Pxyz, gridp)
 NC, NHF = len(C), len(CHF)
 
 if mode0 == "PROMPT":
-	ORB_List= calc_all(NC, NBF, AO_List, C, gridp)
-	HFO_List= calc_all(NHF, NBF, AO_List, CHF, gridp)
+	# orbitals are calculated when first needed
+	CACHE = orbital_cache(SHELLS, L, M, N, R, NN, GRID, C, CHF,
+                          screen, c_tol, tile, nprocs, orb_cache)
+	# and, in the background, the VB orbitals in batches of 4 (not with
+	# nprocs > 1: the process pools are only started by the main thread)
+	if prefetch and nprocs <= 1:
+		start_worker(CACHE, [("VB", range(i, min(i + 4, NC)))
+                             for i in range(0, NC, 4)])
 	print(" There are {0} HF and {1} VB orbitals available.".\
           format(NHF,NC))
 else:
@@ -158,37 +148,49 @@ else:
 	# mode ORB
 	if mode[0] == 'ORB':
 		norb = int(mode[1]) - 1	
-		PSI = calc_orb(NBF, AO_List, C, norb, gridp)
+		JOB = job_orb(C, norb)
 	# mode HFORB
 	elif mode[0] == 'HFORB':
 		norb = int(mode[1]) - 1
-		PSI = calc_orb(NBF, AO_List, CHF, norb, gridp)
+		JOB = job_orb(CHF, norb)
 	# mode QC, INT, TOT
 	elif mode[0] in DENS:
-		N = list(map(int, mode[1:]))
-
+		OSET = list(map(int, mode[1:]))
 		# calculate just the needed orbitals
-		ORB_List = []
-		for a in range(NC):
-			ORB_List.append([])
-			if a+1 in N:
-				ORB_List[a] = calc_orb(NBF, AO_List, C, a, gridp)
-
-		if mode[0] == "QC":
-			PSI = calc_QC(N, ORB_List, OVERLAPS, D_MATRIX, gridp)
-		elif mode[0] == "INT":
-			PSI = calc_INT(N, ORB_List, OVERLAPS, D_MATRIX, gridp)
-		elif mode[0] == "TOT":
-			PSI = calc_TOT(N, ORB_List, D_MATRIX, gridp)
+		JOB = job_dens(mode[0], C, OSET, OVERLAPS, D_MATRIX,
+                       natural, occ_tol)
 	#end
+	if mode[0] in MORB + DENS:
+		# progressive: calculated while it is plotted (see below)
+		STAGES = calc_progressive(SHELLS, L, M, N, R, NN, GRID, [JOB],
+                                  screen, c_tol, tile, nprocs)
+		if np.ndim(offset) > 0:
+			# offset sweep: all the planes at once. The AOs are separable,
+			# so their in-plane factors are calculated once for all the
+			# planes. The tiles keep the memory of a single plane.
+			if tile <= 0:
+				tile = int(np.ceil(gridp/sqrt(len(offset))))
+			STAGES = [(1, calc_psi(SHELLS, L, M, N, R, NN, GRID, [JOB],
+                                   screen, c_tol, tile, nprocs))]
+		elif adaptive > 0:
+			PSI, npoints = calc_adaptive(SHELLS, L, M, N, R, NN, GRID, [JOB],
+                                         adaptive, screen, c_tol, tile, nprocs)
+			print(" Adaptive grid: {0} of {1} points calculated.".\
+                  format(npoints, gridp**2))
+			STAGES = [(1, PSI)]
+		elif not progressive:
+			STAGES = [(1, calc_psi(SHELLS, L, M, N, R, NN, GRID, [JOB],
+                                   screen, c_tol, tile, nprocs))]
 #end
 print()
 
 # Graphic setup
 print(" Setting up plot...")
+X0, Y0 = X1.copy(), Y1.copy() # in bohr, for the planes of a sweep
 Atom_posx, Atom_posy, Atom_labl,\
 label_x, label_y, X1, Y1 = Plot_Settings(ATOMS, NATOMS, R, draw_atom,
-                                         plane, offset, p_unit, X1, Y1)
+                                         plane, np.ravel(offset)[0],
+                                         p_unit, X1, Y1)
 print()
 
 
@@ -196,71 +198,148 @@ print()
 # Main Program
 # Prompt mode
 if mode == "PROMPT":
+	LAST = None # last command plotted and its grid
 	while True:
-		mode1 = input("gpfplot [{0}]> ".format(out_file[:-4]))	
-		mode1 = ssplit(mode1)
-
-		if mode1 == []: # just pressed enter
-			continue
-
-		elif mode1[0] == "exit":
-			exit()
-
-		elif "=" in mode1[0]:
-			c_fill, color_f, c_lines, color_l, c_label,\
-			min_c, max_c, nconts, auto_c,\
-			p_unit, draw_atom, draw_name, title = \
-            parse3_prompt(mode1, c_fill, color_f, c_lines, color_l, \
-			c_label, min_c, max_c, nconts, auto_c,\
-			p_unit, draw_atom, draw_name, title)
-
-		else:
-			# Create Plot Window
-			fig = plt.figure()
-
-			# mode ORB
-			if mode1[0] == 'ORB':
-				norb = int( mode1[1] ) - 1
-				fig.canvas.manager.set_window_title("{0} ORB {1}".\
-                                          format(out_file[:-4], norb+1))
-				PSI = ORB_List[ norb ]
-
-			# mode HFORB
-			elif mode1[0] == 'HFORB':
-				norb = int( mode1[1] ) - 1
-				fig.canvas.manager.set_window_title("{0} HFORB {1}".\
-                                          format(out_file[:-4], norb+1))
-				PSI = HFO_List[ norb ]
-
-			# mode QC, INT, TOT
-			elif mode1[0] in DENS:
-				if dens_file == "":
-					print("Error. No density matrix file defined.")
-					plt.close()
-					continue			
-
-				N = list( map(int, mode1[1:]) )
-				fig.canvas.manager.set_window_title("{0} {2} {1}".\
-                                            format(out_file[:-4],
-                                            " ".join(str(N)), mode1[0]))
-				if mode1[0] == "QC":
-					PSI = calc_QC(N, ORB_List, OVERLAPS, D_MATRIX, gridp)
-				elif mode1[0] == "INT":
-					PSI = calc_INT(N, ORB_List, OVERLAPS, D_MATRIX, gridp)
-				elif mode1[0] == "TOT":
-					PSI = calc_TOT(N, ORB_List, D_MATRIX, gridp)
-			else:
-				print("Invalid mode! Try again.")
-				plt.close()
+		try:
+			mode1 = input("gpfplot [{0}]> ".format(out_file[:-4]))	
+			mode1 = ssplit(mode1)
+
+			if mode1 == []: # just pressed enter
 				continue
 
-			Plot_Function(plt, c_fill, color_f, c_lines, color_l,
-                          c_label, min_c, max_c, nconts, auto_c, p_unit,
-                          draw_atom, draw_name, Atom_posx, Atom_posy,
-                          Atom_labl, label_x, label_y, X1, Y1, PSI, 0)
-			if title != "": plt.suptitle(title, fontsize=16)
-			plt.show()
-			#fig.clf() # It crashes matplotlib in more recent versions
+			elif mode1[0] == "exit":
+				stop_worker(CACHE)
+				exit()
+
+			elif "=" in mode1[0]:
+				c_fill, color_f, c_lines, color_l, c_label,\
+				min_c, max_c, nconts, auto_c,\
+				p_unit, draw_atom, draw_name, title = \
+                parse3_prompt(mode1, c_fill, color_f, c_lines, color_l, \
+				c_label, min_c, max_c, nconts, auto_c,\
+				p_unit, draw_atom, draw_name, title)
+
+				# zoom and pan: only the new grid points are calculated
+				view = parse2_prompt(mode1, plane, gridp, Xlim, Ylim, offset)
+				if view != (plane, gridp, Xlim, Ylim, offset):
+					old = (plane, gridp, Xlim, Ylim, offset)
+					plane, gridp, Xlim, Ylim, offset = view
+					try:
+						X2, Y2, GRID = calcgrid(plane, Xlim, Ylim, gridp,
+                                                offset)
+						# only the orbitals of the last plot are kept
+						keep = []
+						if LAST is not None and LAST[0][0] in MORB:
+							keep = [("VB" if LAST[0][0] == "ORB" else "HF",
+                                     [int(LAST[0][1]) - 1])]
+						elif LAST is not None:
+							keep = [("VB", [int(i) - 1 for i in LAST[0][1:]])]
+						change_grid(CACHE, GRID, keep)
+					except KeyboardInterrupt: # the old grid is kept
+						plane, gridp, Xlim, Ylim, offset = old
+						GRID = CACHE["calc"][-1]
+						raise
+					Atom_posx, Atom_posy, Atom_labl, label_x, label_y,\
+					X1, Y1 = Plot_Settings(ATOMS, NATOMS, R, draw_atom,
+                                           plane, offset, p_unit, X2, Y2)
+					# replot calculates the last command again
+					if LAST is not None: LAST = (LAST[0], None)
+
+			elif mode1[0] in MORB + DENS and \
+                 not check_mode(mode1, NC, NHF):
+				print("Invalid orbitals! Try again.")
+				continue
+
+			elif mode1[0] == "replot" and LAST is None:
+				print("Nothing to replot yet.")
+				continue
+
+			else:
+				# replot: the last grid again, with the current settings
+				if mode1[0] == "replot":
+					mode1, PSI = LAST
+				else:
+					PSI = None
+				# (s, PSI) with the grid on every s-th point, plotted in
+				# turn (see staged_orbitals)
+				STAGES = [(1, PSI)]
+
+				# Create Plot Window
+				fig = plt.figure()
+
+				# mode ORB
+				if mode1[0] == 'ORB':
+					norb = int( mode1[1] ) - 1
+					fig.canvas.manager.set_window_title("{0} ORB {1}".\
+                                              format(out_file[:-4], norb+1))
+					if PSI is None:
+						STAGES = ((s, PHI[norb]) for s, PHI in
+                                  staged_orbitals(CACHE, "VB", [norb],
+                                                  progressive))
+
+				# mode HFORB
+				elif mode1[0] == 'HFORB':
+					norb = int( mode1[1] ) - 1
+					fig.canvas.manager.set_window_title("{0} HFORB {1}".\
+                                              format(out_file[:-4], norb+1))
+					if PSI is None:
+						STAGES = ((s, PHI[norb]) for s, PHI in
+                                  staged_orbitals(CACHE, "HF", [norb],
+                                                  progressive))
+
+				# mode QC, INT, TOT
+				elif mode1[0] in DENS:
+					if dens_file == "":
+						print("Error. No density matrix file defined.")
+						plt.close()
+						continue			
+
+					OSET = list( map(int, mode1[1:]) )
+					fig.canvas.manager.set_window_title("{0} {2} {1}".\
+                                                format(out_file[:-4],
+                                                " ".join(str(OSET)), mode1[0]))
+					# densities already calculated are in the cache
+					key = (mode1[0], tuple(OSET))
+					if PSI is None:
+						PSI = cache_get(CACHE, key)
+						STAGES = [(1, PSI)]
+					if PSI is None:
+						if mode1[0] == "QC":
+							dens = lambda PHI: calc_QC(OSET, PHI, OVERLAPS,
+                                                       D_MATRIX)
+						elif mode1[0] == "INT":
+							dens = lambda PHI: calc_INT(OSET, PHI, OVERLAPS,
+                                                        D_MATRIX)
+						elif mode1[0] == "TOT":
+							dens = lambda PHI: calc_TOT(OSET, PHI, D_MATRIX,
+                                                        natural, occ_tol)
+						STAGES = ((s, dens(PHI)) for s, PHI in
+                                  staged_orbitals(CACHE, "VB",
+                                                  [i-1 for i in OSET],
+                                                  progressive))
+				else:
+					print("Invalid mode! Try again.")
+					plt.close()
+					continue
+
+				# the coarse stages are replaced in the same figure
+				for s, PSI in STAGES:
+					fig.clf()
+					Plot_Function(plt, c_fill, color_f, c_lines, color_l,
+                                  c_label, min_c, max_c, nconts, auto_c,
+                                  p_unit, draw_atom, draw_name, Atom_posx,
+                                  Atom_posy, Atom_labl, label_x, label_y,
+                                  X1[::s, ::s], Y1[::s, ::s], PSI, 0)
+					if title != "": plt.suptitle(title, fontsize=16)
+					if s > 1: plt.pause(0.01)
+				if mode1[0] in DENS:
+					cache_put(CACHE, key, PSI)
+				LAST = (mode1, PSI)
+				plt.show()
+				#fig.clf() # It crashes matplotlib in more recent versions
+		except KeyboardInterrupt: # Ctrl-C cancels the current command
+			print(" Cancelled.")
+			plt.close("all")
 
 # Single plot mode
 else:
@@ -277,32 +356,65 @@ else:
 	elif mode[0] in DENS:
 		fig.canvas.manager.set_window_title("{0} {2} {1}".\
                                     format(out_file[:-4],
-                                           " ".join(str(N)), mode[0]))
+                                           " ".join(str(OSET)), mode[0]))
 	# error
 	else:
 		print("Invalid mode! Try again.")
 		plt.close()
 		exit(1)
 
-	Plot_Function(plt, c_fill, color_f, c_lines, color_l, c_label,
-                  min_c, max_c, nconts, auto_c, p_unit,
-                  draw_atom, draw_name, Atom_posx, Atom_posy,
-                  Atom_labl, label_x, label_y, X1, Y1, PSI, 0)
-	if title != "": plt.suptitle(title, fontsize=16)
-	print(" "+" ".join(mode)+" plotted.")
-
-	if save_png != "":
-		fig.savefig(save_png+".png", dpi=dpipng)
-		print(" {0}.png plotted.".format(save_png))
-
-	if save_eps != "":
-		fig.savefig(save_eps+".eps", dpi=dpieps)
-		print(" {0}.eps plotted.".format(save_eps))
-
-	if save_txt != "":
-		gen_txt(out_file, dens_file, arg1+".gpfplot", modetxt,
-                plane, Xlim, Ylim, offset, gridp, save_txt, PSI)
-		print(" {0}.txt saved.".format(save_txt))
-
+	if np.ndim(offset) == 0:
+		# the coarse stages are replaced in the same figure
+		for s, PSI in STAGES:
+			PSI = PSI[0]
+			fig.clf()
+			Plot_Function(plt, c_fill, color_f, c_lines, color_l, c_label,
+                          min_c, max_c, nconts, auto_c, p_unit,
+                          draw_atom, draw_name, Atom_posx, Atom_posy,
+                          Atom_labl, label_x, label_y,
+                          X1[::s, ::s], Y1[::s, ::s], PSI, 0)
+			if title != "": plt.suptitle(title, fontsize=16)
+			if s > 1: plt.pause(0.01)
+		print(" "+" ".join(mode)+" plotted.")
+		SLICES = Sweep_Slices(offset, PSI)
+		plot_slice = None
+	else:
+		# offset sweep: one plot per plane, saved as NAME_001, NAME_002...
+		SLICES = Sweep_Slices(offset, STAGES[0][1][0])
+		def plot_slice(k):
+			Atom_posx, Atom_posy, Atom_labl,\
+			label_x, label_y, X, Y = Plot_Settings(ATOMS, NATOMS, R,
+                                                   draw_atom, plane,
+                                                   offset[k], p_unit,
+                                                   X0.copy(), Y0.copy())
+			fig.clf()
+			Plot_Function(plt, c_fill, color_f, c_lines, color_l, c_label,
+                          min_c, max_c, nconts, auto_c, p_unit,
+                          draw_atom, draw_name, Atom_posx, Atom_posy,
+                          Atom_labl, label_x, label_y, X, Y,
+                          SLICES[k][1], 0)
+
+	Save_Slices(fig, SLICES, plot_slice, title, plane, " ".join(mode),
+                (save_png, save_eps, dpipng, dpieps, save_txt, save_npy,
+                 save_anim, fps),
+                (__version__, out_file, dens_file, arg1+".gpfplot", modetxt,
+                 Xlim, Ylim, gridp))
+
+	if save_cube != "" or save_vol != "":
+		VGRID = calcvolume(plane, Xlim, Ylim, Wlim, gridp)
+		save_volume(SHELLS, L, M, N, R, NN, VGRID, [JOB],
+                    [(save_cube, save_vol)], [out_file + " " + modetxt],
+                    NATOMS, CHARGE, screen, c_tol, tile, nprocs,
+                    lambda done, total: print("\r Calculating volume..."
+                    " {0:3d}%".format(100*done//total), end="", flush=True))
+		print()
+		if save_cube != "": print(" {0}.cube saved.".format(save_cube))
+		if save_vol != "": print(" {0}.npy saved.".format(save_vol))
+
+	# the window shows the planes of a sweep in turn (no window with Agg)
+	if len(SLICES) > 1 and plt.get_backend().lower() != "agg":
+		anim = FuncAnimation(fig, lambda k: (plot_slice(k),
+                             Slice_Title(fig, title, plane, SLICES, k)),
+                             frames=len(SLICES), interval=1000/fps)
 	plt.show()
 # The End!
@@ -0,0 +1,185 @@
+#! /usr/bin/env python3
+#
+# GPFPlot Batch Mode
+# Runs many *.gpfplot input files in a single process. Input files
+# which share the output files, plane and grid are calculated together:
+# the output files are parsed and the atomic orbitals are calculated
+# only once for all of them.
+__version__ = '0.2.1'
+#
+# Usage: gpfplot_batch.py INPUTFILE [INPUTFILE ...] [option=value ...]
+# INPUTFILE may be a glob pattern (e.g. "fig*"), with or without the
+# .gpfplot extension. The options override the Performance Settings of
+# every input file.
+
+# Imports and functions ################################################
+import sys
+from glob import glob
+import matplotlib
+matplotlib.use("Agg") # no plot windows, only the saved files
+import matplotlib.pyplot as plt
+from core.parse_input import *
+from core.parse_vb import parse_dmatrix
+from core.cache import load_out
+from core.operations import *
+from core.volume import calcvolume, save_volume
+from core.plot_utils import Plot_Function, Plot_Settings, Sweep_Slices,\
+                             Save_Slices
+
+# INPUT READING ########################################################
+gpf_files, options = [], []
+for arg in sys.argv[1:]:
+	if "=" in arg:
+		options.append(arg)
+		continue
+	if not arg.endswith(".gpfplot"):
+		arg += ".gpfplot"
+	found = sorted(glob(arg))
+	if found == []:
+		print(" Warning: no input file matches " + arg)
+	gpf_files += found
+
+if gpf_files == []:
+	print("Please specify input (*.gpfplot) files.")
+	exit(1)
+
+# input files grouped by the output files, plane and grid they use
+GROUPS = {}
+for gpf_file in gpf_files:
+	infile = open(gpf_file, 'r').read().split('\n')
+	out_file, dens_file, mode = parse1(infile)
+	mode = mode.split()
+	if out_file == "":
+		print(" {0}: GAMESS / VB2000 input file not specified, skipped.".\
+              format(gpf_file))
+		continue
+	if mode == [] or mode[0] not in MORB + DENS:
+		print(" {0}: mode {1} not available in batch mode, skipped.".\
+              format(gpf_file, " ".join(mode)))
+		continue
+	if mode[0] in DENS and dens_file == "":
+		print(" {0}: density matrix file is required for mode {1},"
+              " skipped.".format(gpf_file, mode[0]))
+		continue
+	plane, gridp, Xlim, Ylim, offset = parse2(infile)
+	key = (out_file, dens_file, plane, Xlim, Ylim, gridp, offset)
+	GROUPS.setdefault(key, []).append((gpf_file, infile, mode))
+print()
+
+########################################################################
+# PROGRAM START
+for key, group in GROUPS.items():
+	out_file, dens_file, plane, Xlim, Ylim, gridp, offset = key
+	# the grid is calculated with the settings of the first input file
+	screen, c_tol, tile, nprocs, cache, natural, occ_tol,\
+	orb_cache, prefetch, progressive, adaptive = parse5(options + group[0][1])
+	if nprocs > 1 and not parallel_ok():
+		print(" Warning: nprocs > 1 is not available on this platform.")
+		nprocs = 1
+
+	print(" Loading input files: " + out_file)
+	NATOMS, CHARGE, ATOMS, R, L, M, N, A, IATOM, CC,\
+	NBF, GL, C, hf, g99, CHF, OVERLAPS = load_out(out_file, cache)
+	C, CHF = np.array(C), np.array(CHF)
+	D_MATRIX = None
+	if dens_file != "":
+		if OVERLAPS is None:
+			print(" ERROR: Overlap matrices not found in " + out_file)
+			group = [J for J in group if J[2][0] not in DENS]
+		else:
+			jobtext2 = open(dens_file, 'r').readlines()
+			D_MATRIX = parse_dmatrix(jobtext2, GL[:-1] if g99 else GL)
+
+	# one job per input file
+	JOBS, valid = [], []
+	for gpf_file, infile, mode in group:
+		if not check_mode(mode, len(C), len(CHF)):
+			print(" {0}: invalid orbitals in mode {1}, skipped.".\
+                  format(gpf_file, " ".join(mode)))
+			continue
+		natural, occ_tol = parse5(options + infile)[5:7]
+		JOBS.append(mode_job(mode, C, CHF, OVERLAPS, D_MATRIX,
+                             natural, occ_tol))
+		valid.append((gpf_file, infile, mode, JOBS[-1]))
+	if JOBS == []:
+		continue
+
+	print(" Calculating {0} plot(s) on plane {1}...".\
+          format(len(JOBS), plane))
+	X1, Y1, GRID = calcgrid(plane, Xlim, Ylim, gridp, offset)
+	NN = NNorm(L, M, N, A, CC, NBF)
+	SHELLS = make_shells(A, CC, IATOM)
+	if np.ndim(offset) > 0: # offset sweep (see gpfplot.py)
+		if tile <= 0:
+			tile = int(np.ceil(gridp/sqrt(len(offset))))
+		PSI_List = calc_psi(SHELLS, L, M, N, R, NN, GRID, JOBS,
+                            screen, c_tol, tile, nprocs)
+	elif adaptive > 0: # refined where any of the plots needs it
+		PSI_List, npoints = calc_adaptive(SHELLS, L, M, N, R, NN, GRID,
+                                          JOBS, adaptive, screen, c_tol,
+                                          tile, nprocs)
+		print(" Adaptive grid: {0} of {1} points calculated.".\
+              format(npoints, gridp**2))
+	else:
+		PSI_List = calc_psi(SHELLS, L, M, N, R, NN, GRID, JOBS,
+                            screen, c_tol, tile, nprocs)
+
+	VOLUMES = {} # volume jobs, by their range of W
+	for (gpf_file, infile, mode, JOB), PSI in zip(valid, PSI_List):
+		c_fill, color_f, c_lines, color_l, c_label,\
+		min_c, max_c, nconts, auto_c,\
+		p_unit, draw_atom, draw_name, title = parse3(infile, mode[0])
+		save_png, save_eps, dpipng, dpieps,\
+		save_txt, save_npy = parse4(infile)
+		Wlim, save_cube, save_vol, save_anim, fps = parse6(infile)
+		if save_cube != "" or save_vol != "":
+			J = VOLUMES.setdefault(Wlim, ([], [], [], []))
+			J[0].append(JOB)
+			J[1].append((save_cube, save_vol))
+			J[2].append(out_file + " " + " ".join(mode))
+			J[3].append(gpf_file)
+		if "" == save_png == save_eps == save_txt == save_npy == save_anim:
+			if save_cube != "" or save_vol != "":
+				continue
+			print(" {0}: no output file defined, skipped.".\
+                  format(gpf_file))
+			continue
+
+		# offset sweep: one plot per plane, saved as NAME_001, NAME_002...
+		SLICES = Sweep_Slices(offset, PSI)
+		fig = plt.figure()
+		def plot_slice(k):
+			# Plot_Settings changes the grid in place
+			Atom_posx, Atom_posy, Atom_labl,\
+			label_x, label_y, X, Y = Plot_Settings(ATOMS, NATOMS, R,
+                                                   draw_atom, plane,
+                                                   SLICES[k][0], p_unit,
+                                                   X1.copy(), Y1.copy())
+			fig.clf()
+			Plot_Function(plt, c_fill, color_f, c_lines, color_l, c_label,
+                          min_c, max_c, nconts, auto_c, p_unit,
+                          draw_atom, draw_name, Atom_posx, Atom_posy,
+                          Atom_labl, label_x, label_y, X, Y,
+                          SLICES[k][1], 0)
+
+		Save_Slices(fig, SLICES, plot_slice, title, plane,
+                    gpf_file + ": " + " ".join(mode),
+                    (save_png, save_eps, dpipng, dpieps, save_txt, save_npy,
+                     save_anim, fps),
+                    (__version__, out_file, dens_file, gpf_file,
+                     " ".join(mode), Xlim, Ylim, gridp))
+		plt.close(fig)
+
+	# volumes with the same range are calculated together
+	for Wlim, (VJOBS, NAMES, TITLES, FILES) in VOLUMES.items():
+		print(" Calculating {0} volume(s)...".format(len(VJOBS)))
+		VGRID = calcvolume(plane, Xlim, Ylim, Wlim, gridp)
+		save_volume(SHELLS, L, M, N, R, NN, VGRID, VJOBS, NAMES, TITLES,
+                    NATOMS, CHARGE, screen, c_tol, tile, nprocs)
+		for gpf_file, (save_cube, save_vol) in zip(FILES, NAMES):
+			if save_cube != "":
+				print(" {0}: {1}.cube saved.".format(gpf_file, save_cube))
+			if save_vol != "":
+				print(" {0}: {1}.npy saved.".format(gpf_file, save_vol))
+	print()
+# The End!
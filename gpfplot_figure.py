@@ -19,6 +19,7 @@ from core.parse_input import *
 from core.parse_vb import parse_geom
 from core.plot_utils import Plot_Function, Plot_Settings
 from core.operations import RAng
+from core.grid_files import load_grid
 
 # Read variables #######################################################
 figure_name = "C2H4_sigmaCC"     
@@ -59,42 +60,19 @@ titles=[ r"$\mathdefault{" + i + "}$" for i in titles]
 
 # For each p_list object ###############################################
 for i in range(len(p_list)):
-	# Parse text grids 
-	f = open(p_list[i]+".txt")
-	ln = f.readline()
-	ln = f.readline()
-	out_file = ln[23:-1]
-	ln = f.readline()
-	#dens_file = ln[23:-1]
-	ln = f.readline()
-	gpf_file = ln[23:-1]
-	ln = f.readline()
-	mode = ln[2:-1]
-	ln = f.readline()
-	plane = ln[9:11]
-	ln = f.readline()
-	Xrng = ln[11:-1]
-	ln = f.readline()
-	Yrng = ln[11:-1]
-	ln = f.readline()
-	offset = float( ln[11:-1] )
-	ln = f.readline()
-	gridp = int( ln[13:].split("x")[0] )
-	f.close()
-
-	Xlim = tuple(map(float, Xrng.replace("(","").replace(")","").split(",")))
-	Ylim = tuple(map(float, Yrng.replace("(","").replace(")","").split(",")))
+	# Read the grid (*.npy memory-mapped, or *.txt) and its header
+	out_file, dens_file, gpf_file, mode, plane, Xlim, Ylim, offset,\
+    gridp, PSI = load_grid(p_list[i])
+
 	XX = np.linspace(Xlim[0], Xlim[1], gridp)
 	YY = np.linspace(Ylim[0], Ylim[1], gridp)
 	X, Y = np.meshgrid(XX, YY)
 
-	PSI = np.loadtxt(p_list[i]+".txt", skiprows=10)
-
 	mode0 = mode.split(" ")[0]
 	gpf_text = open(gpf_file,'r').read().split('\n')
 	c_fill, color_f, c_lines, color_l, c_label,\
         min_c, max_c, nconts, auto_c,\
-	    p_unit, draw_atom, draw_name = parse3(gpf_text, mode0)
+	    p_unit, draw_atom, draw_name, title = parse3(gpf_text, mode0)
 	
 	out_text = open(out_file,'r').readlines()
 	NATOMS, CHARGE, ATOMS, R = parse_geom(out_text)